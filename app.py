@@ -1,9 +1,14 @@
+import os
 import streamlit as st
 from datetime import datetime
 import time  # Thêm thư viện time để đo thời gian
 from pdf_processor_adaptive import PDFProcessor
 from chat_handler_openai import ChatHandler
 from chat_history import ChatHistory
+from background_ingest import start_background_ingest, format_eta
+from folder_watcher import start_folder_watcher
+from model_registry import load_processor_in_background
+from context_packer import packer_for
 
 # Phần đầu của file app.py - thêm vào đầu file
 st.set_page_config(
@@ -72,11 +77,22 @@ with header_col2:
 st.markdown('<div class="main-content">', unsafe_allow_html=True)
 
 # Khởi tạo session state
-if 'processor' not in st.session_state:
-    st.session_state.processor = PDFProcessor()
-    # Tự động xử lý PDF khi khởi động
-    with st.spinner("Đang kiểm tra và xử lý các file PDF mới..."):
-        st.session_state.processor.process_pdfs()
+# Một PDFProcessor (model embedding, reranker, Chroma) dùng chung cho mọi phiên trình duyệt.
+# Model được nạp trong nền để giao diện hiện ra ngay khi khởi động.
+# INFERENCE_BACKEND=onnx chạy model embedding/reranker bằng ONNX Runtime int8 (nhanh hơn trên CPU)
+# VECTOR_STORE=faiss-hnsw (hoặc faiss-flat, faiss-ivfpq, faiss-int8, faiss-binary) dùng chỉ mục FAISS thay cho Chroma
+processor_loader = load_processor_in_background(
+    PDFProcessor,
+    inference_backend=os.getenv("INFERENCE_BACKEND", "torch"),
+    vector_store=os.getenv("VECTOR_STORE", "chroma")
+)
+if 'processor' not in st.session_state and processor_loader.done() and processor_loader.exception() is None:
+    st.session_state.processor = processor_loader.result()
+    # Tự động xử lý PDF mới trong nền, vẫn có thể hỏi đáp trên các tài liệu đã lập chỉ mục
+    st.session_state.ingest_job = start_background_ingest(st.session_state.processor)
+    # Theo dõi thư mục pdf_documents để tự động xử lý file được thêm, sửa hoặc xóa
+    start_folder_watcher(st.session_state.processor)
+models_ready = 'processor' in st.session_state
 
 if 'chat_handler' not in st.session_state:
     st.session_state.chat_handler = ChatHandler()
@@ -87,8 +103,45 @@ if 'current_session_id' not in st.session_state:
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
+# Chờ model nạp xong rồi chạy lại toàn bộ trang
+@st.fragment(run_every=1)
+def wait_for_models():
+    if processor_loader.done():
+        if processor_loader.exception() is not None:
+            st.error(f"Lỗi khi nạp mô hình: {processor_loader.exception()}")
+            return
+        st.rerun()
+    st.caption("Đang nạp mô hình tìm kiếm...")
+
+# Tiến độ xử lý PDF trong nền, tự cập nhật trong khi đang chạy
+@st.fragment(run_every=2 if models_ready and st.session_state.ingest_job.is_running() else None)
+def show_ingest_status():
+    status = st.session_state.ingest_job.status()
+    if status['status'] == "scanning":
+        st.caption("Đang kiểm tra các file PDF mới...")
+    elif status['status'] == "running":
+        total = max(status['total_files'], 1)
+        st.progress(
+            status['files_done'] / total,
+            text=f"Đang xử lý PDF: {status['files_done']}/{status['total_files']} file"
+        )
+        st.caption(
+            f"{status['pages_per_sec']:.1f} trang/giây - còn lại khoảng {format_eta(status['eta'])}"
+        )
+    elif status['status'] == "failed":
+        st.error(f"Lỗi khi xử lý PDF: {status['error']}")
+    elif status['total_files']:
+        st.caption(
+            f"Đã xử lý {status['files_done']}/{status['total_files']} file PDF mới "
+            f"trong {status['elapsed']:.0f} giây"
+        )
+
 # Sidebar cho quản lý chat
 with st.sidebar:
+    if models_ready:
+        show_ingest_status()
+    else:
+        wait_for_models()
     st.header("Lịch sử chat")
     if st.button("Tạo cuộc hội thoại mới"):
         st.session_state.current_session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -116,8 +169,10 @@ for message in st.session_state.messages:
         # Hiển thị thời gian trả lời nếu có
         if message["role"] == "assistant" and "response_time" in message:
             st.markdown(f"<div class='response-time'>Câu trả lời được tạo ra trong {message['response_time']:.2f} giây</div>", unsafe_allow_html=True)
+        if message["role"] == "assistant" and "context_tokens" in message:
+            st.markdown(f"<div class='response-time'>Ngữ cảnh: {message['context_tokens']} token (bớt {message['context_tokens_saved']} token)</div>", unsafe_allow_html=True)
 
-if question := st.chat_input("Nhập câu hỏi của bạn:"):
+if question := st.chat_input("Nhập câu hỏi của bạn:", disabled=not models_ready):
     # Thêm câu hỏi vào messages với timestamp
     current_time = datetime.now().strftime("%H:%M:%S %d/%m/%Y")
     st.session_state.messages.append({
@@ -137,7 +192,8 @@ if question := st.chat_input("Nhập câu hỏi của bạn:"):
             
             # Tìm context liên quan
             similar_docs = st.session_state.processor.search_similar(question)
-            context = "\n".join([doc.page_content for doc in similar_docs])
+            # Giữ ngữ cảnh trong ngân sách token của backend (prefill trên NPU tỉ lệ với số token)
+            context, packing = packer_for(st.session_state.chat_handler).pack(question, similar_docs)
             
             # Tạo câu trả lời với context từ lịch sử
             response = st.session_state.chat_handler.generate_response(
@@ -156,6 +212,7 @@ if question := st.chat_input("Nhập câu hỏi của bạn:"):
             current_time = datetime.now().strftime("%H:%M:%S %d/%m/%Y")
             st.markdown(f"<div class='timestamp'>Thời gian: {current_time}</div>", unsafe_allow_html=True)
             st.markdown(f"<div class='response-time'>Câu trả lời được tạo ra trong {response_time:.2f} giây</div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='response-time'>Ngữ cảnh: {packing['tokens_after']} token (bớt {packing['tokens_saved']} token)</div>", unsafe_allow_html=True)
             
             # Lưu thông tin vào messages
             st.session_state.messages.append({
@@ -163,7 +220,9 @@ if question := st.chat_input("Nhập câu hỏi của bạn:"):
                 "content": response,
                 "assistant_content": response,
                 "timestamp": current_time,
-                "response_time": response_time
+                "response_time": response_time,
+                "context_tokens": packing['tokens_after'],
+                "context_tokens_saved": packing['tokens_saved']
             })
 
             # Lưu lịch sử chat
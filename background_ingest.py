@@ -0,0 +1,72 @@
+import threading
+import traceback
+from pdf_ingest import IngestProgress
+
+
+class BackgroundIngest:
+    """
+    Runs processor.process_pdfs on a daemon thread so the UI stays responsive.
+    Files are committed one at a time, so searches during the job already see
+    every file indexed so far.
+    """
+
+    def __init__(self, processor, workers=None):
+        self.processor = processor
+        self.workers = workers
+        self.progress = IngestProgress()
+        self.error = None
+        self._thread = None
+
+    def start(self):
+        self.progress.status = "scanning"
+        self._thread = threading.Thread(target=self._run, name="background-ingest", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.processor.process_pdfs(workers=self.workers, progress=self.progress)
+        except Exception as e:
+            traceback.print_exc()
+            self.error = str(e)
+            self.progress.finish("failed")
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        """Progress snapshot (see IngestProgress.snapshot) plus the error, if any"""
+        snapshot = self.progress.snapshot()
+        if self.is_running() and snapshot['status'] == "idle":
+            snapshot['status'] = "scanning"
+        snapshot['error'] = self.error
+        return snapshot
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def start_background_ingest(processor, workers=None):
+    """
+    Start ingesting for `processor` unless a job for the same db directory is
+    already running in this process, in which case that job is returned.
+    """
+    with _jobs_lock:
+        job = _jobs.get(processor.db_directory)
+        if job is None or not job.is_running():
+            job = BackgroundIngest(processor, workers).start()
+            _jobs[processor.db_directory] = job
+        return job
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "đang ước tính"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} giờ {minutes} phút"
+    if minutes:
+        return f"{minutes} phút {seconds} giây"
+    return f"{seconds} giây"
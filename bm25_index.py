@@ -0,0 +1,200 @@
+"""
+Persistent BM25 inverted index over the chunks in the vector store.
+
+Dense vectors are poor at exact codes, names and article numbers
+("Điều 12", "RK3588S", "15/2020/NĐ-CP"); this index finds them by term
+match. Text is tokenized into Vietnamese syllables plus adjacent-syllable
+bigrams (most Vietnamese words are two syllables), and dotted/dashed/slashed
+codes are also kept as whole tokens. Postings live in an SQLite file next to
+the Chroma data and only the query's terms are read per search; just the
+document lengths are kept in memory.
+"""
+import os
+import re
+import math
+import heapq
+import sqlite3
+import threading
+import unicodedata
+import collections
+
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+_SYLLABLE = re.compile(r"\w+")
+_QUESTION_MARKERS = [
+    "là gì", "là ai", "thế nào", "như thế nào", "tại sao", "vì sao", "bao nhiêu", "bao giờ",
+    "khi nào", "ở đâu", "có phải", "có nên", "làm sao", "cách nào", "giải thích", "so sánh",
+]
+
+
+def normalize_text(text):
+    return unicodedata.normalize("NFC", text).casefold()
+
+
+def tokenize(text):
+    """Syllables, adjacent-syllable bigrams and whole codes of `text`, lowercased"""
+    tokens = []
+    previous = None
+    for match in _TOKEN.finditer(normalize_text(text)):
+        compound = match.group()
+        syllables = _SYLLABLE.findall(compound)
+        if len(syllables) > 1:
+            tokens.append(compound)
+            previous = None
+        for syllable in syllables:
+            tokens.append(syllable)
+            if previous is not None:
+                tokens.append(previous + " " + syllable)
+            previous = syllable
+    return tokens
+
+
+def code_tokens(text):
+    """Tokens of `text` that hold a number or a dotted/dashed/slashed code ("12", "rk3588s", "15/2020/nđ-cp")"""
+    return frozenset(
+        token for token in tokenize(text)
+        if " " not in token and (any(ch.isdigit() for ch in token) or _SYLLABLE.fullmatch(token) is None)
+    )
+
+
+def is_keyword_query(query, max_words=4):
+    """
+    True for short lookups of a code, number or name rather than a question,
+    e.g. "RK3588S", "Điều 12", "nghị định 15/2020/NĐ-CP", or anything in quotes.
+    """
+    stripped = query.strip()
+    if len(stripped) > 2 and stripped[0] in "\"'“" and stripped[-1] in "\"'”":
+        return True
+    if "?" in stripped:
+        return False
+    lowered = normalize_text(stripped)
+    if any(marker in lowered for marker in _QUESTION_MARKERS):
+        return False
+
+    words = stripped.split()
+    has_code = any(
+        any(ch.isdigit() for ch in word) or (len(word) > 1 and word.isupper())
+        for word in words
+    )
+    return has_code and len(words) <= max_words
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk IDs, updated incrementally with add_documents/delete.
+
+    Postings are read from `path` (SQLite) per query term at search time;
+    document lengths are loaded on start.
+    `meta.complete` records whether the index covers the whole vector store,
+    so an index created next to an existing db can be backfilled once.
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # chunk_id -> number of tokens
+        self._docs = {}
+        self._total_length = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._load()
+
+    def _load(self):
+        for chunk_id, length in self._conn.execute("SELECT chunk_id, length FROM docs"):
+            self._docs[chunk_id] = length
+            self._total_length += length
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._docs
+
+    @property
+    def complete(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'complete'").fetchone()
+        return row is not None and row[0] == "1"
+
+    def mark_complete(self):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('complete', '1')")
+
+    def _remove(self, chunk_ids):
+        removed = []
+        for chunk_id in chunk_ids:
+            length = self._docs.pop(chunk_id, None)
+            if length is None:
+                continue
+            self._total_length -= length
+            removed.append((chunk_id,))
+        if removed:
+            self._conn.executemany("DELETE FROM postings WHERE chunk_id = ?", removed)
+            self._conn.executemany("DELETE FROM docs WHERE chunk_id = ?", removed)
+
+    def add_documents(self, chunk_ids, texts):
+        """Index (or re-index) the given chunks"""
+        with self._lock, self._conn:
+            self._remove(chunk_ids)
+            doc_rows = []
+            posting_rows = []
+            for chunk_id, text in zip(chunk_ids, texts):
+                counts = collections.Counter(tokenize(text))
+                length = sum(counts.values())
+                self._docs[chunk_id] = length
+                self._total_length += length
+                posting_rows.extend((term, chunk_id, tf) for term, tf in counts.items())
+                doc_rows.append((chunk_id, length))
+            self._conn.executemany("INSERT INTO docs (chunk_id, length) VALUES (?, ?)", doc_rows)
+            self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posting_rows)
+
+    def delete(self, chunk_ids):
+        with self._lock, self._conn:
+            self._remove(chunk_ids)
+
+    def search(self, query, k=10):
+        """Top `k` (chunk_id, BM25 score) pairs for `query`"""
+        with self._lock:
+            num_docs = len(self._docs)
+            if num_docs == 0:
+                return []
+            avg_length = self._total_length / num_docs
+            terms = list(set(tokenize(query)))
+            postings = collections.defaultdict(list)
+            # The (term, chunk_id) primary key makes this a range scan per query term
+            for i in range(0, len(terms), 500):
+                batch = terms[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT term, chunk_id, tf FROM postings WHERE term IN ({', '.join('?' * len(batch))})", batch
+                )
+                for term, chunk_id, tf in rows:
+                    postings[term].append((chunk_id, tf))
+
+            scores = collections.defaultdict(float)
+            for term, term_postings in postings.items():
+                df = len(term_postings)
+                idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+                for chunk_id, tf in term_postings:
+                    length = self._docs[chunk_id]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked lists of IDs: score(id) = sum of 1 / (k + rank)"""
+    scores = collections.defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
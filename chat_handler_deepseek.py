@@ -11,6 +11,9 @@ class ChatHandler:
             base_url="https://api.deepseek.com"
         )
         self.conversation_memory = []
+        self.model_name = "deepseek-chat"
+        # Số token ngữ cảnh tối đa (API trên cloud, không bị giới hạn bởi NPU)
+        self.context_token_budget = 6000
 
     def generate_response(self, context, question, chat_history):
         # Tạo context từ lịch sử chat
@@ -33,7 +36,7 @@ Hãy trả lời câu hỏi sau bằng tiếng Việt, có tính đến ngữ c
 Chỉ trả lời dựa trên thông tin có trong ngữ cảnh và lịch sử hội thoại. Nếu không có thông tin, hãy nói rằng bạn không tìm thấy thông tin liên quan."""
         try:
             response = self.client.chat.completions.create(
-                model="deepseek-chat",
+                model=self.model_name,
                 messages=[
                     {"role": "system", "content": "Bạn là trợ lý AI giúp trả lời câu hỏi dựa trên nội dung tài liệu PDF bằng tiếng Việt. Hãy trả lời một cách mạch lạc và có tính đến ngữ cảnh của cuộc hội thoại."},
                     {"role": "user", "content": prompt}
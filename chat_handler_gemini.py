@@ -17,6 +17,8 @@ class ChatHandler:
             system_instruction=system_instruction
         )
         # self.conversation_memory = [] # Biến này hiện chưa được sử dụng trong generate_response
+        # Số token ngữ cảnh tối đa (API trên cloud, không bị giới hạn bởi NPU)
+        self.context_token_budget = 8000
 
     def generate_response(self, context, question, chat_history):
         # Tạo ngữ cảnh từ lịch sử chat (giữ nguyên logic của bạn)
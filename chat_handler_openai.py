@@ -1,12 +1,13 @@
 import time
 import json
 import requests
-from langchain.prompts import PromptTemplate
 
 class ChatHandler:
     def __init__(self):
         self.base_url = "http://127.0.0.1:8080/v1"  # API tương thích OpenAI
         self.temperature = 0.8
+        # Số token ngữ cảnh tối đa: prefill trên NPU tăng tuyến tính theo số token
+        self.context_token_budget = 1536
         
         try:
             # Kiểm tra kết nối và lấy thông tin model từ máy chủ
@@ -1,12 +1,13 @@
 import time
 from llama_index.llms.ollama import Ollama
-from langchain.prompts import PromptTemplate
 
 class ChatHandler:
     def __init__(self):
         self.base_url = "http://127.0.0.1:8080"
         self.model_name = "Qwen2.5-7B-Instruct-rk3588-w8a8-opt-0-hybrid-ratio-0.0"
         self.temperature = 0.8
+        # Số token ngữ cảnh tối đa: model 7B prefill trên NPU chậm hơn nhiều so với model 1B
+        self.context_token_budget = 1024
         
         try:
             # Initialize LLM with the exact parameters from the working example
@@ -0,0 +1,197 @@
+"""
+Fit retrieved passages into a token budget before they go into the LLM prompt.
+
+On the RK3588 prompt prefill time grows linearly with the number of tokens and
+dominates time-to-first-token, so the context is packed per chat backend
+(ChatHandler.context_token_budget). When the passages are over budget, their
+sentences are ranked by how many query terms they share (weighted by how rare
+the term is among the candidate sentences, with a small bonus for higher-ranked
+passages) and the best ones are kept, in their original order, until the
+budget is full. Token counts come from the model's own tokenizer when it can
+be loaded (cached per process, and per sentence), else from a character estimate.
+"""
+import re
+import math
+import threading
+import collections
+from bm25_index import tokenize
+
+DEFAULT_TOKEN_BUDGET = 1024
+# Vietnamese text averages about 3 characters per token with the Qwen/Gemma tokenizers
+CHARS_PER_TOKEN = 3.0
+# Upper bound on what the " " / "\n" between two joined parts adds to their separate counts
+JOIN_TOKENS = 1
+# Tokenizer to count with, by a substring of the chat model's name
+TOKENIZERS = {
+    "qwen": "Qwen/Qwen2.5-7B-Instruct",
+    "gemma": "unsloth/gemma-3-1b-it",
+    "deepseek": "deepseek-ai/DeepSeek-V3",
+}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;:…])\s+|\n+")
+
+
+def tokenizer_for_model(model_name):
+    lowered = (model_name or "").lower()
+    return next((tokenizer for key, tokenizer in TOKENIZERS.items() if key in lowered), None)
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence and sentence.strip()]
+
+
+def join_sentences(passages, kept):
+    """Passages rebuilt from their `kept` (passage, sentence) indexes, with "…" where sentences were left out"""
+    packed = []
+    for p, sentences in enumerate(passages):
+        parts = []
+        for s, sentence in enumerate(sentences):
+            if (p, s) in kept:
+                parts.append(sentence)
+            elif not parts or parts[-1] != "…":
+                parts.append("…")
+        if any(part != "…" for part in parts):
+            packed.append(" ".join(parts))
+    return "\n".join(packed)
+
+
+class ContextPacker:
+    """
+    Packs documents into at most `token_budget` tokens of context.
+    Sentence token counts are kept in an LRU of `cache_size` entries, since the
+    same chunks come back for many questions.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, tokenizer_name=None, cache_size=8192):
+        self.token_budget = token_budget
+        self.tokenizer_name = tokenizer_name
+        self.cache_size = cache_size
+        self._tokenizer = None
+        self._tokenizer_loaded = False
+        self._counts = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Separate from _lock so cached counts are still served while the tokenizer loads
+        self._tokenizer_lock = threading.Lock()
+
+    def _get_tokenizer(self):
+        if not self._tokenizer_loaded:
+            # Callers wait for the first load, so no count is ever estimated while it runs
+            with self._tokenizer_lock:
+                if not self._tokenizer_loaded:
+                    if self.tokenizer_name:
+                        from model_registry import get_tokenizer
+                        self._tokenizer = get_tokenizer(self.tokenizer_name)
+                    self._tokenizer_loaded = True
+        return self._tokenizer
+
+    def _count(self, text):
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def count_tokens(self, text):
+        with self._lock:
+            count = self._counts.get(text)
+            if count is not None:
+                self._counts.move_to_end(text)
+                return count
+        count = self._count(text)
+        with self._lock:
+            self._counts[text] = count
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return count
+
+    def pack(self, query, documents):
+        """
+        Returns (context, stats) where stats holds tokens_before, tokens_after,
+        tokens_saved, sentences_dropped and token_budget.
+        """
+        # Whole contexts are counted as they are (not cached: they rarely repeat)
+        context = "\n".join(doc.page_content for doc in documents)
+        tokens_before = self._count(context)
+        stats = {
+            'tokens_before': tokens_before,
+            'tokens_after': tokens_before,
+            'tokens_saved': 0,
+            'sentences_dropped': 0,
+            'token_budget': self.token_budget,
+        }
+        if tokens_before <= self.token_budget:
+            return context, stats
+
+        passages = [split_sentences(doc.page_content) for doc in documents]
+        counts = [[self.count_tokens(sentence) for sentence in sentences] for sentences in passages]
+
+        # Term weights: query terms that few candidate sentences contain matter most
+        query_terms = set(tokenize(query))
+        sentence_terms = [[set(tokenize(sentence)) & query_terms for sentence in sentences] for sentences in passages]
+        document_frequency = collections.Counter(
+            term for terms_list in sentence_terms for terms in terms_list for term in terms
+        )
+        num_sentences = sum(len(sentences) for sentences in passages)
+
+        ranked = []
+        for p, terms_list in enumerate(sentence_terms):
+            for s, terms in enumerate(terms_list):
+                score = sum(math.log(1 + num_sentences / document_frequency[term]) for term in terms)
+                # Ties (and sentences without query terms) go to the better-ranked passage, then earlier sentences
+                ranked.append((score + 1.0 / (2 + p), -p, -s, p, s))
+        ranked.sort(reverse=True)
+
+        # Candidate sets are costed from the cached sentence counts plus a fixed cost per
+        # "…" marker and join, so only the final text is tokenized again
+        marker_tokens = self.count_tokens("…")
+        kept = []
+        for _, _, _, p, s in ranked:
+            if self._packed_tokens(passages, counts, set(kept + [(p, s)]), marker_tokens) <= self.token_budget:
+                kept.append((p, s))
+
+        packed = join_sentences(passages, set(kept))
+        tokens_after = self._count(packed)
+        # Safety net in case the joined text ever tokenizes longer than its estimate
+        while tokens_after > self.token_budget and kept:
+            kept.pop()
+            packed = join_sentences(passages, set(kept))
+            tokens_after = self._count(packed)
+
+        stats['tokens_after'] = tokens_after
+        stats['tokens_saved'] = tokens_before - tokens_after
+        stats['sentences_dropped'] = num_sentences - len(kept)
+        return packed, stats
+
+    @staticmethod
+    def _packed_tokens(passages, counts, kept, marker_tokens):
+        """Token estimate for join_sentences(passages, kept), without tokenizing it"""
+        total = 0
+        num_packed = 0
+        for p, sentences in enumerate(passages):
+            tokens = 0
+            parts = 0
+            has_sentence = False
+            last_is_marker = False
+            for s in range(len(sentences)):
+                if (p, s) in kept:
+                    tokens += counts[p][s]
+                    has_sentence = True
+                    last_is_marker = False
+                elif parts and last_is_marker:
+                    continue
+                else:
+                    tokens += marker_tokens
+                    last_is_marker = True
+                parts += 1
+            if has_sentence:
+                total += tokens + (parts - 1) * JOIN_TOKENS
+                num_packed += 1
+        return total + max(num_packed - 1, 0) * JOIN_TOKENS
+
+
+def packer_for(chat_handler):
+    """Shared ContextPacker for the budget and model of `chat_handler`"""
+    from model_registry import get_context_packer
+    return get_context_packer(
+        getattr(chat_handler, 'context_token_budget', DEFAULT_TOKEN_BUDGET),
+        tokenizer_for_model(getattr(chat_handler, 'model_name', None))
+    )
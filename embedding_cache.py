@@ -0,0 +1,216 @@
+import os
+import re
+import json
+import fcntl
+import hashlib
+import threading
+import contextlib
+import unicodedata
+import collections
+import numpy as np
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper with a persistent, content-addressed vector cache.
+
+    Vectors are keyed by (model name, sha1 of the text) and stored per model in
+    `cache_dir/<model>/`: `vectors.f32` is a flat float32 array read through a
+    memory map and `keys.txt` holds one text hash per row. Only texts that are
+    not in the cache reach the wrapped model, so rebuilding the `db` directory
+    for an unchanged corpus and model does no inference at all.
+
+    Rows are appended (vector first, then key) and a torn tail is trimmed on
+    load, so a crash mid-write never leaves a key pointing at a bad vector.
+    The row of a key is its line number in `keys.txt`. Several processes can
+    share one directory: appends and reloads hold an flock on `.lock`, and each
+    instance picks up rows the others appended when it misses a text.
+
+    Query vectors are kept separately in a bounded in-memory LRU keyed on
+    (model, normalized query), so repeated questions skip the model entirely.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache_dir: str = "embedding_cache", model_name: str = None,
+                 query_cache_size: int = 512):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model_name", type(embeddings).__name__)
+        self.cache_dir = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", self.model_name))
+        self._vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        self._keys_path = os.path.join(self.cache_dir, "keys.txt")
+        self._meta_path = os.path.join(self.cache_dir, "meta.json")
+        self._lock_path = os.path.join(self.cache_dir, ".lock")
+        self._lock = threading.Lock()
+        self._index = {}
+        self._dim = None
+        self._vectors = None
+        self._mapped_rows = 0
+        # Rows of vectors.f32 (and bytes of keys.txt) already read into _index
+        self._num_rows = 0
+        self._keys_offset = 0
+        self.hits = 0
+        self.misses = 0
+        self.query_cache_size = query_cache_size
+        self._query_cache = collections.OrderedDict()
+        self.query_hits = 0
+        self.query_misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared by every process using this cache directory"""
+        with open(self._lock_path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _load(self):
+        with self._file_lock():
+            self._sync()
+
+    def _sync(self):
+        """Read the rows appended since the last call, by any process; needs the file lock"""
+        if self._dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path, 'r') as f:
+                self._dim = json.load(f)["dim"]
+
+        data = b""
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, 'rb') as f:
+                f.seek(self._keys_offset)
+                data = f.read()
+        lines = data[:data.rfind(b"\n") + 1].split(b"\n")[:-1]
+        row_bytes = self._dim * 4
+        stored_rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+
+        # Trim whatever a crash left half-written: a partial key line, keys without a
+        # vector, or vectors without a key
+        lines = lines[:max(stored_rows - self._num_rows, 0)]
+        keys_size = self._keys_offset + sum(len(line) + 1 for line in lines)
+        if keys_size != self._keys_offset + len(data):
+            os.truncate(self._keys_path, keys_size)
+        num_rows = self._num_rows + len(lines)
+        if os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) != num_rows * row_bytes:
+            os.truncate(self._vectors_path, num_rows * row_bytes)
+
+        # Row = line number; a key written twice keeps its first row
+        for row, line in enumerate(lines, start=self._num_rows):
+            self._index.setdefault(line.decode("ascii"), row)
+        self._num_rows = num_rows
+        self._keys_offset = keys_size
+
+    def _map(self):
+        if self._num_rows == 0:
+            self._vectors = None
+        else:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(self._num_rows, self._dim))
+        self._mapped_rows = self._num_rows
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _append(self, keys, vectors):
+        with self._file_lock():
+            # Another process may have embedded some of these texts already
+            self._sync()
+            fresh = [(key, vector) for key, vector in zip(keys, vectors) if key not in self._index]
+            if not fresh:
+                return
+            keys = [key for key, _ in fresh]
+            vectors = np.asarray([vector for _, vector in fresh], dtype=np.float32)
+            if self._dim is None:
+                self._dim = int(vectors.shape[1])
+                with open(self._meta_path, 'w') as f:
+                    json.dump({"model_name": self.model_name, "dim": self._dim}, f)
+
+            start = os.path.getsize(self._vectors_path) // (self._dim * 4) if os.path.exists(self._vectors_path) else 0
+            with open(self._vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._keys_path, 'a') as f:
+                f.writelines(key + "\n" for key in keys)
+
+            for offset, key in enumerate(keys):
+                self._index.setdefault(key, start + offset)
+            self._num_rows = start + len(keys)
+            self._keys_offset = os.path.getsize(self._keys_path)
+
+    def lookup(self, texts):
+        """Return the cached vector (or None) for each text"""
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            if (any(key not in self._index for key in keys) and os.path.exists(self._keys_path)
+                    and os.path.getsize(self._keys_path) > self._keys_offset):
+                # Rows appended by another process sharing the directory
+                with self._file_lock():
+                    self._sync()
+            if any(self._index.get(key, -1) >= self._mapped_rows for key in keys):
+                self._map()
+            return [
+                np.array(self._vectors[self._index[key]]) if key in self._index else None
+                for key in keys
+            ]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = self.lookup(texts)
+        # Identical texts in one batch only need to be embedded once
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        self.hits += len(texts) - sum(1 for vector in cached if vector is None)
+        self.misses += len(missing)
+
+        if missing:
+            new_vectors = self.embeddings.embed_documents(missing)
+            new_keys = [self._key(text) for text in missing]
+            with self._lock:
+                self._append(new_keys, new_vectors)
+            computed = dict(zip(missing, new_vectors))
+            cached = [
+                vector if vector is not None else computed[text]
+                for text, vector in zip(texts, cached)
+            ]
+
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in cached]
+
+    @staticmethod
+    def normalize_query(text):
+        """Unicode NFC and collapsed whitespace; case is kept since the models are cased"""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def embed_query(self, text: str) -> List[float]:
+        query = self.normalize_query(text)
+        key = (self.model_name, query)
+        with self._lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.query_hits += 1
+                return list(vector)
+            self.query_misses += 1
+
+        vector = self.embeddings.embed_query(query)
+        with self._lock:
+            self._query_cache[key] = tuple(vector)
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return list(vector)
+
+    def query_cache_stats(self):
+        with self._lock:
+            total = self.query_hits + self.query_misses
+            return {
+                'hits': self.query_hits,
+                'misses': self.query_misses,
+                'hit_rate': self.query_hits / total if total else 0.0,
+                'size': len(self._query_cache),
+                'max_size': self.query_cache_size,
+            }
@@ -0,0 +1,176 @@
+import os
+import json
+import hashlib
+import tempfile
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# xxh3 is several times faster than MD5; blake2b is the fastest hash in the stdlib
+HASH_ALGORITHM = "xxh3_128" if xxhash is not None else "blake2b"
+READ_SIZE = 1 << 20
+
+
+def _new_hasher(algorithm):
+    if algorithm == "xxh3_128":
+        return xxhash.xxh3_128()
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(algorithm)
+
+
+def hash_file(filepath, algorithm=HASH_ALGORITHM):
+    """Hash the file content with the given algorithm"""
+    hasher = _new_hasher(algorithm)
+    with open(filepath, 'rb') as f:
+        buf = f.read(READ_SIZE)
+        while len(buf) > 0:
+            hasher.update(buf)
+            buf = f.read(READ_SIZE)
+    return hasher.hexdigest()
+
+
+def write_json_atomic(path, data):
+    """
+    Write JSON to `path` via a temp file in the same directory, fsync it and
+    rename it over the target, so readers only ever see the old or the new file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Persist the rename itself
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def manifest_path(path, vector_store):
+    """
+    Manifest of one vector store: `path` itself for Chroma (the original store),
+    processed_files.<store>.json next to it for the others, so each one records
+    what its own store holds.
+    """
+    if vector_store == "chroma":
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{vector_store}{ext or '.json'}"
+
+
+def load_manifest(path):
+    """
+    The processed files manifest at `path`, with the entries recorded in its
+    journal since it was last compacted applied on top. A torn last journal
+    line (a crash mid-append) is ignored.
+    """
+    entries = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            entries = json.load(f)
+    journal = path + ".journal"
+    if os.path.exists(journal):
+        with open(journal, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record["entry"] is None:
+                    entries.pop(record["file"], None)
+                else:
+                    entries[record["file"]] = record["entry"]
+    return entries
+
+
+def append_manifest_entry(path, file, entry):
+    """
+    Record one file's manifest entry (None when it was removed) by appending it
+    to the journal next to `path`: a checkpoint per file costs one line instead
+    of rewriting the whole manifest.
+    """
+    with open(path + ".journal", 'a') as f:
+        f.write(json.dumps({"file": file, "entry": entry}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def compact_manifest(path, entries):
+    """Write the whole manifest atomically and drop the journal it now includes"""
+    write_json_atomic(path, entries)
+    # Replaying a journal left behind by a crash right here only repeats what the file already says
+    if os.path.exists(path + ".journal"):
+        os.remove(path + ".journal")
+
+
+def get_file_stat(filepath):
+    """The stat fields used to detect changes without reading the file"""
+    st = os.stat(filepath)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino}
+
+
+def stat_matches(entry, stat):
+    return all(entry.get(key) == value for key, value in stat.items())
+
+
+def find_changed_files(pdf_folder, entries, verify=False, files=None):
+    """
+    Find new or changed PDFs in `pdf_folder` given the processed files manifest.
+
+    Files whose size, mtime and inode match the manifest are skipped without
+    being read. Only the remaining candidates are hashed; a candidate whose
+    content hash still matches (e.g. it was just touched or copied back) only has
+    its stat refreshed in `entries`. Entries written before stat tracking are
+    compared with the algorithm they were hashed with (MD5) and upgraded in place.
+    With verify=True every file is hashed regardless of its stat. `files`
+    restricts the check to those file names instead of listing the folder.
+
+    Returns (changed, num_refreshed) where changed is a list of
+    (file, pdf_path, file_hash, stat) tuples.
+    """
+    changed = []
+    num_refreshed = 0
+
+    for file in sorted(files if files is not None else os.listdir(pdf_folder)):
+        if not file.endswith('.pdf'):
+            continue
+        pdf_path = os.path.join(pdf_folder, file)
+        if files is not None and not os.path.exists(pdf_path):
+            continue
+        try:
+            stat = get_file_stat(pdf_path)
+            entry = entries.get(file)
+
+            if entry is not None and not verify and stat_matches(entry, stat):
+                continue
+
+            current_hash = hash_file(pdf_path)
+            if entry is not None:
+                algorithm = entry.get('hash_algo', 'md5')
+                previous_hash = current_hash if algorithm == HASH_ALGORITHM else hash_file(pdf_path, algorithm)
+                if entry.get('hash') == previous_hash:
+                    entry.update(stat, hash=current_hash, hash_algo=HASH_ALGORITHM)
+                    num_refreshed += 1
+                    continue
+
+            changed.append((file, pdf_path, current_hash, stat))
+        except OSError as e:
+            # The file may be deleted or still being written; try again next scan
+            print(f"Error checking file {file}: {str(e)}")
+
+    return changed, num_refreshed
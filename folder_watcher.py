@@ -0,0 +1,146 @@
+import os
+import time
+import threading
+from file_manifest import get_file_stat, stat_matches
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class _WakeUpHandler(FileSystemEventHandler):
+    def __init__(self, wake_event):
+        self.wake_event = wake_event
+
+    def on_any_event(self, event):
+        self.wake_event.set()
+
+
+class FolderWatcher:
+    """
+    Watches the PDF folder and hands only new, changed or deleted files to the processor.
+
+    Every `interval` seconds (or right away on an inotify event when watchdog is
+    installed) the folder is listed and each PDF's size/mtime/inode is compared
+    with processed_files.json - no file is read. A changed file is only queued
+    once its size and mtime have stayed the same for `debounce` seconds, so
+    files that are still being copied in are not ingested half-written. PDFs
+    that disappear from the folder have their chunks removed.
+    """
+
+    def __init__(self, processor, interval=2.0, debounce=3.0):
+        self.processor = processor
+        self.interval = interval
+        self.debounce = debounce
+        # file -> (stat, time the stat was first seen)
+        self._candidates = {}
+        # file -> stat of a version that failed to ingest; retried once it changes
+        self._failed = {}
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    def start(self):
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_WakeUpHandler(self._wake_event), self.processor.pdf_folder, recursive=False)
+            self._observer.start()
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error watching {self.processor.pdf_folder}: {str(e)}")
+            # While files are settling, come back as soon as they could be ready
+            timeout = min(self.interval, self.debounce) if self._candidates else self.interval
+            self._wake_event.wait(timeout)
+            self._wake_event.clear()
+
+    def _scan(self):
+        stats = {}
+        with os.scandir(self.processor.pdf_folder) as entries:
+            for entry in entries:
+                if entry.name.endswith('.pdf') and entry.is_file():
+                    st = entry.stat()
+                    stats[entry.name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino}
+        return stats
+
+    def _current_stat(self, file):
+        try:
+            return get_file_stat(os.path.join(self.processor.pdf_folder, file))
+        except OSError:
+            return None
+
+    def poll(self):
+        """Check the folder once and ingest/remove whatever is ready. Returns (ingested, removed)."""
+        now = time.time()
+        stats = self._scan()
+        # Copy: the ingest thread may add entries while we look
+        processed = dict(self.processor.processed_files)
+
+        ready = []
+        for file, stat in stats.items():
+            entry = processed.get(file)
+            if (entry is not None and stat_matches(entry, stat)) or self._failed.get(file) == stat:
+                self._candidates.pop(file, None)
+                continue
+
+            previous = self._candidates.get(file)
+            if previous is None or previous[0] != stat:
+                # New or still growing: (re)start the debounce timer
+                self._candidates[file] = (stat, now)
+            elif now - previous[1] >= self.debounce:
+                ready.append(file)
+
+        deleted = [file for file in processed if file not in stats]
+        for tracked in (self._candidates, self._failed):
+            for file in [file for file in tracked if file not in stats]:
+                del tracked[file]
+
+        if deleted:
+            print(f"Watcher: {len(deleted)} PDF files removed from {self.processor.pdf_folder}")
+            self.processor.remove_files(deleted)
+        if ready:
+            # Re-check right before ingesting in case the file changed after the last scan
+            ready = [file for file in ready if self._current_stat(file) == stats[file]]
+        if ready:
+            print(f"Watcher: ingesting {len(ready)} new or changed PDF files")
+            self.processor.process_pdfs(files=ready)
+            for file in ready:
+                self._candidates.pop(file, None)
+                entry = self.processor.processed_files.get(file)
+                if entry is None or not stat_matches(entry, stats[file]):
+                    self._failed[file] = stats[file]
+
+        return ready, deleted
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def start_folder_watcher(processor, interval=2.0, debounce=3.0):
+    """Start one watcher per PDF folder in this process and return it"""
+    with _watchers_lock:
+        watcher = _watchers.get(processor.pdf_folder)
+        if watcher is None or not watcher.is_running():
+            watcher = FolderWatcher(processor, interval, debounce).start()
+            _watchers[processor.pdf_folder] = watcher
+        return watcher
@@ -0,0 +1,64 @@
+import os
+import re
+import shutil
+import sqlite3
+
+_SEGMENT_DIR = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def directory_size(path):
+    """Total size in bytes of all files under `path`"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def remove_orphan_segments(db_directory):
+    """
+    Delete Chroma vector segment directories that no segment in chroma.sqlite3
+    refers to any more (left behind by deleted or recreated collections).
+    Returns the number of bytes freed.
+    """
+    sqlite_path = os.path.join(db_directory, "chroma.sqlite3")
+    if not os.path.exists(sqlite_path):
+        return 0
+
+    with sqlite3.connect(sqlite_path) as conn:
+        try:
+            live_segments = {row[0] for row in conn.execute("SELECT id FROM segments")}
+        except sqlite3.DatabaseError as e:
+            print(f"Cannot read Chroma segments, skipping segment cleanup: {str(e)}")
+            return 0
+
+    freed = 0
+    for name in os.listdir(db_directory):
+        path = os.path.join(db_directory, name)
+        if os.path.isdir(path) and _SEGMENT_DIR.match(name) and name not in live_segments:
+            freed += directory_size(path)
+            shutil.rmtree(path)
+            print(f"Removed orphaned segment directory {name}")
+    return freed
+
+
+def vacuum_chroma(db_directory):
+    """Rebuild chroma.sqlite3 so pages freed by deletes are returned to the filesystem"""
+    sqlite_path = os.path.join(db_directory, "chroma.sqlite3")
+    if not os.path.exists(sqlite_path):
+        return
+    conn = sqlite3.connect(sqlite_path, timeout=30)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def format_bytes(num_bytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(num_bytes) < 1024 or unit == "GB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes} B"
+        num_bytes /= 1024
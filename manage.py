@@ -0,0 +1,485 @@
+"""
+Command line maintenance for the PDF index.
+
+    python manage.py ingest [--verify] [--workers N] [--processor adaptive]
+    python manage.py watch [--interval 2] [--debounce 3]
+    python manage.py gc
+    python manage.py bench-sessions [--sessions 5] [--mode both|shared|per-session]
+    python manage.py bench-rerank [--concurrency 8] [--queries 40]
+    python manage.py bench-backend [--kind embedding|reranker] [--sentences 64]
+    python manage.py profile-startup [--budget 5] [--with-models]
+    python manage.py bench-vector-store [--sizes 10000,100000,1000000] [--backends chroma,faiss-hnsw]
+    python manage.py --vector-store faiss-int8 quantization-report [-k 5] [--queries 100]
+"""
+import os
+import sys
+import json
+import argparse
+import importlib
+import subprocess
+import time
+
+PROCESSORS = {
+    "basic": ("pdf_processor", "PDFProcessor"),
+    "rerank": ("pdf_processor_rerank", "PDFProcessor"),
+    "adaptive": ("pdf_processor_adaptive", "PDFProcessor"),
+}
+
+
+def load_processor(args):
+    module_name, class_name = PROCESSORS[args.processor]
+    processor_class = getattr(importlib.import_module(module_name), class_name)
+    return processor_class(
+        pdf_folder=args.pdf_folder,
+        db_directory=args.db_directory,
+        processed_files_path=args.processed_files,
+        inference_backend=args.backend,
+        search_mode=args.search_mode,
+        vector_store=args.vector_store,
+    )
+
+
+def cmd_ingest(args):
+    processor = load_processor(args)
+    start_time = time.time()
+    processor.process_pdfs(workers=args.workers, verify=args.verify)
+    print(f"Ingest finished in {time.time() - start_time:.2f}s")
+
+
+def cmd_watch(args):
+    from folder_watcher import FolderWatcher
+
+    processor = load_processor(args)
+    processor.process_pdfs()
+    watcher = FolderWatcher(processor, interval=args.interval, debounce=args.debounce).start()
+    print(f"Watching {processor.pdf_folder} (Ctrl+C to stop)")
+    try:
+        while watcher.is_running():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()
+
+
+def cmd_gc(args):
+    processor = load_processor(args)
+    stats = processor.collect_garbage()
+    print(f"Vectors removed: {stats['vectors_removed']}")
+    print(f"Bytes reclaimed: {stats['bytes_reclaimed']}")
+
+
+def cmd_bench_sessions(args):
+    """
+    Simulate browser sessions getting their processor the way the apps do and
+    report RSS after each one. "shared" goes through the registry, so RSS should
+    stay flat after the first session; "per-session" builds a processor and its
+    models for every session, as the apps did before the registry. "both" runs
+    each mode in a fresh interpreter and compares them.
+    """
+    from model_registry import get_processor, clear_registry, get_rss_bytes
+    from index_maintenance import format_bytes
+
+    if args.mode == "both":
+        growth = {}
+        for mode in ("per-session", "shared"):
+            print(f"--- {mode} ---", flush=True)
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ["--mode", mode],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+            )
+            print(completed.stdout, end="")
+            lines = [line for line in completed.stdout.splitlines() if line.startswith("BENCH ")]
+            if completed.returncode != 0 or not lines:
+                print(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"{mode} failed")
+                sys.exit(2)
+            growth[mode] = json.loads(lines[-1][len("BENCH "):])["rss_growth"]
+        print(
+            f"RSS over baseline after {args.sessions} sessions: per-session {format_bytes(growth['per-session'])}, "
+            f"shared {format_bytes(growth['shared'])} ({format_bytes(growth['per-session'] - growth['shared'])} saved)"
+        )
+        return
+
+    module_name, class_name = PROCESSORS[args.processor]
+    processor_class = getattr(importlib.import_module(module_name), class_name)
+    kwargs = dict(
+        pdf_folder=args.pdf_folder,
+        db_directory=args.db_directory,
+        processed_files_path=args.processed_files,
+        inference_backend=args.backend,
+        search_mode=args.search_mode,
+        vector_store=args.vector_store,
+    )
+
+    baseline = get_rss_bytes()
+    print(f"Baseline RSS: {format_bytes(baseline)}")
+    sessions = []
+    rss = baseline
+    for i in range(args.sessions):
+        start_time = time.time()
+        if args.mode == "per-session":
+            # Nothing is shared: the processor, its models and stores are built again
+            clear_registry()
+        processor = get_processor(processor_class, **kwargs)
+        processor.search_similar("kiểm tra")
+        sessions.append(processor)
+        rss = get_rss_bytes()
+        print(
+            f"Session {i + 1}: RSS {format_bytes(rss)} (+{format_bytes(rss - baseline)} over baseline), "
+            f"created in {time.time() - start_time:.2f}s"
+        )
+    print("BENCH " + json.dumps({"rss_growth": rss - baseline}))
+
+
+def cmd_bench_rerank(args):
+    """
+    Fire `queries` rerank requests of `passages` pairs each from `concurrency`
+    threads, once calling the CrossEncoder directly per request and once through
+    the micro-batching RerankService, and report pairs per second for both.
+    """
+    import concurrent.futures
+    from model_registry import get_reranker
+    from rerank_service import RerankService
+
+    reranker = get_reranker(args.model, quantize=args.quantize, backend=args.backend)
+    if reranker is None:
+        return
+    service = RerankService(reranker, max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000)
+    passages = [f"Đoạn văn bản thử nghiệm số {i} về cấu hình Orange Pi và mô hình ngôn ngữ." for i in range(args.passages)]
+    queries = [f"Câu hỏi thử nghiệm số {i} về Orange Pi?" for i in range(args.queries)]
+
+    def direct(query):
+        return reranker.predict([(query, passage) for passage in passages])
+
+    def batched(query):
+        return service.score(query, passages)
+
+    total_pairs = args.queries * args.passages
+    for label, fn in (("direct", direct), ("micro-batched", batched)):
+        start_time = time.time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(fn, queries))
+        elapsed = time.time() - start_time
+        print(f"{label}: {total_pairs} pairs in {elapsed:.2f}s ({total_pairs / elapsed:.1f} pairs/s)")
+
+    stats = service.stats()
+    print(
+        f"Service: {stats['batches']} predict calls for {stats['requests']} requests, "
+        f"{stats['avg_batch_pairs']:.1f} pairs per batch, {stats['pairs_per_sec']:.1f} pairs/s of model time"
+    )
+
+
+SAMPLE_SENTENCES = [
+    "Orange Pi 5 sử dụng chip Rockchip RK3588S với 8 nhân CPU.",
+    "Bo mạch hỗ trợ bộ nhớ RAM LPDDR4 lên tới 32GB.",
+    "NPU tích hợp có hiệu năng 6 TOPS dùng cho các mô hình AI.",
+    "Cách cài đặt hệ điều hành lên thẻ nhớ microSD.",
+    "Hướng dẫn cấu hình mạng Wi-Fi và Bluetooth trên Ubuntu.",
+    "Nguồn cấp điện khuyến nghị là 5V 4A qua cổng USB Type-C.",
+    "Tài liệu mô tả sơ đồ chân GPIO 26 pin của bo mạch.",
+    "Chạy mô hình ngôn ngữ lớn bằng rkllama trên NPU.",
+]
+
+
+def _sample_texts(args, limit):
+    """Chunks from the index if there is one, otherwise built-in Vietnamese sentences"""
+    texts = []
+    try:
+        import chromadb
+        client = chromadb.PersistentClient(path=args.db_directory)
+        texts = client.get_collection("langchain").get(limit=limit, include=["documents"])["documents"]
+    except Exception as e:
+        print(f"Using built-in sample sentences ({str(e)})")
+    if not texts:
+        texts = SAMPLE_SENTENCES
+    return [texts[i % len(texts)] for i in range(limit)]
+
+
+def cmd_bench_backend(args):
+    """
+    Check the ONNX int8 export against PyTorch on the same inputs and compare
+    sentences (or pairs) per second.
+    """
+    from onnx_backend import compare_embedding_backends, compare_reranker_backends
+
+    texts = _sample_texts(args, args.sentences)
+    if args.kind == "embedding":
+        model = args.model or "thanhtantran/Vietnamese_Embedding_v2"
+        stats = compare_embedding_backends(model, texts, repeats=args.repeats)
+        print(f"Cosine torch vs onnx: min {stats['min_cosine']:.4f}, mean {stats['mean_cosine']:.4f}")
+        print(f"Nearest-neighbour agreement: {stats['neighbour_agreement']:.1%}")
+        unit = "sentences/s"
+    else:
+        model = args.model or "thanhtantran/Vietnamese_Reranker"
+        stats = compare_reranker_backends(model, SAMPLE_SENTENCES[0], texts, repeats=args.repeats)
+        print(f"Max score difference: {stats['max_abs_diff']:.4f}")
+        print(f"Top-1 agreement: {stats['top1_agree']}, top-5 overlap: {stats['top5_overlap']:.0%}")
+        unit = "pairs/s"
+    print(f"torch: {stats['torch_per_sec']:.1f} {unit}")
+    print(f"onnx int8: {stats['onnx_per_sec']:.1f} {unit} ({stats['onnx_per_sec'] / stats['torch_per_sec']:.2f}x)")
+
+
+# What `streamlit run app.py` imports before the first page is drawn
+STARTUP_MODULES = [
+    "streamlit", "pdf_processor_adaptive", "chat_handler_openai", "chat_history",
+    "background_ingest", "folder_watcher", "model_registry", "context_packer",
+]
+# Must only be imported once models load or a PDF is actually processed
+HEAVY_MODULES = [
+    "torch", "sentence_transformers", "transformers", "langchain", "langchain_core",
+    "langchain_huggingface", "langchain_chroma", "chromadb", "fitz", "pdf2image", "pytesseract",
+]
+
+_PROFILE_SCRIPT = """
+import sys, json, time
+# Everything importtime reports after this line is ours, not interpreter start-up
+print("PROFILE-START", file=sys.stderr, flush=True)
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+result = {{"import_time": time.perf_counter() - start}}
+result["heavy"] = [name for name in {heavy!r} if name in sys.modules]
+if {with_models!r}:
+    import importlib
+    from model_registry import get_processor
+    module_name, class_name = {processor!r}
+    start = time.perf_counter()
+    get_processor(getattr(importlib.import_module(module_name), class_name))
+    result["model_time"] = time.perf_counter() - start
+print("PROFILE " + json.dumps(result))
+"""
+
+
+def _parse_importtime(stderr):
+    """Cumulative microseconds per top-level import from `python -X importtime` output"""
+    totals = {}
+    stderr = stderr[stderr.find("PROFILE-START"):]
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two extra spaces per level
+        if name.startswith("  "):
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(cumulative)
+    return totals
+
+
+def cmd_profile_startup(args):
+    """
+    Import what the app imports at start-up in a fresh interpreter and print where
+    the time goes. Exits non-zero if it takes longer than --budget seconds or if a
+    heavy dependency is imported eagerly, so it can guard start-up time in CI.
+    """
+    modules = args.modules.split(",") if args.modules else STARTUP_MODULES
+    script = _PROFILE_SCRIPT.format(
+        modules=modules, heavy=HEAVY_MODULES, with_models=args.with_models,
+        processor=PROCESSORS[args.processor]
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+    )
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("PROFILE ")]
+    if completed.returncode != 0 or not lines:
+        print(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "Profiling failed")
+        sys.exit(2)
+    result = json.loads(lines[-1][len("PROFILE "):])
+
+    totals = _parse_importtime(completed.stderr)
+    print(f"{'module':<32}{'cumulative':>12}")
+    for package, micros in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{package:<32}{micros / 1e6:>11.3f}s")
+    print(f"Import time: {result['import_time']:.2f}s (budget {args.budget:.2f}s)")
+    if "model_time" in result:
+        print(f"Model loading (in the background in the app): {result['model_time']:.2f}s")
+
+    failed = False
+    if result["heavy"]:
+        print(f"Imported eagerly at start-up: {', '.join(result['heavy'])}")
+        failed = True
+    if result["import_time"] > args.budget:
+        print("Start-up import time is over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+_VECTOR_STORE_SCRIPT = """
+import sys, json, time, tempfile
+import numpy as np
+from model_registry import get_rss_bytes
+from index_maintenance import directory_size
+from vector_stores import create_vector_store
+
+backend, size, dim, num_queries, batch_size = {backend!r}, {size!r}, {dim!r}, {queries!r}, {batch_size!r}
+rng = np.random.default_rng(0)
+# Libraries are loaded before the baseline, so RSS growth is the index and its data
+import langchain_core.documents
+__import__("langchain_chroma" if backend == "chroma" else "faiss")
+with tempfile.TemporaryDirectory() as db_directory:
+    rss_before = get_rss_bytes()
+    start = time.perf_counter()
+    store = create_vector_store(backend, db_directory, None)
+    for offset in range(0, size, batch_size):
+        n = min(batch_size, size - offset)
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = ["chunk-%d" % i for i in range(offset, offset + n)]
+        store.upsert(
+            ids=ids, embeddings=vectors.tolist() if backend == "chroma" else vectors,
+            metadatas=[{{"file_name": "file%d.pdf" % (i // 100), "page": 0}} for i in range(offset, offset + n)],
+            documents=ids
+        )
+    store.persist()
+    build_time = time.perf_counter() - start
+
+    queries = rng.standard_normal((num_queries, dim), dtype=np.float32)
+    store.similarity_search_by_vector_with_relevance_scores(queries[0].tolist(), k=5)  # warm-up
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        store.similarity_search_by_vector_with_relevance_scores(query.tolist(), k=5)
+        latencies.append(time.perf_counter() - start)
+    result = {{
+        "build_time": build_time,
+        "mean_ms": 1000 * float(np.mean(latencies)),
+        "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+        "rss": get_rss_bytes() - rss_before,
+        "disk": directory_size(db_directory),
+    }}
+print("BENCH " + json.dumps(result))
+"""
+
+
+def cmd_bench_vector_store(args):
+    """
+    Build each vector store from synthetic unit vectors at each size and report
+    build time, query latency, RSS growth and size on disk. Every run is a fresh
+    interpreter so RSS isn't inflated by the previous one.
+    """
+    from index_maintenance import format_bytes
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    backends = args.backends.split(",")
+    print(f"{'store':<14}{'chunks':>10}{'build':>10}{'mean':>10}{'p95':>10}{'RSS':>12}{'disk':>12}")
+    for size in sizes:
+        for backend in backends:
+            script = _VECTOR_STORE_SCRIPT.format(
+                backend=backend, size=size, dim=args.dim, queries=args.queries, batch_size=5000
+            )
+            completed = subprocess.run(
+                [sys.executable, "-c", script],
+                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+            )
+            lines = [line for line in completed.stdout.splitlines() if line.startswith("BENCH ")]
+            if completed.returncode != 0 or not lines:
+                error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"
+                print(f"{backend:<14}{size:>10}  {error}")
+                continue
+            result = json.loads(lines[-1][len("BENCH "):])
+            print(
+                f"{backend:<14}{size:>10}{result['build_time']:>9.1f}s{result['mean_ms']:>8.2f}ms"
+                f"{result['p95_ms']:>8.2f}ms{format_bytes(result['rss']):>12}{format_bytes(result['disk']):>12}"
+            )
+
+
+def cmd_quantization_report(args):
+    """Recall@k of the int8/binary/IVF-PQ store against exact search, and RAM saved"""
+    from vector_stores import FaissStore, LOSSY_INDEX_TYPES
+    from index_maintenance import format_bytes
+
+    index_type = args.vector_store[len("faiss-"):]
+    if index_type not in LOSSY_INDEX_TYPES:
+        print(f"{args.vector_store} searches exact vectors; use --vector-store faiss-int8, faiss-binary or faiss-ivfpq")
+        sys.exit(2)
+    store = FaissStore(args.db_directory, index_type=index_type, rescore_candidates=args.candidates)
+    try:
+        report = store.quantization_report(k=args.k, num_queries=args.queries)
+    except ValueError as e:
+        print(str(e))
+        sys.exit(2)
+    print(f"Vectors: {report['vectors']}")
+    print(f"Recall@{report['k']} first pass over codes: {report['recall_first_pass']:.1%}")
+    print(f"Recall@{report['k']} after rescoring top {report['rescore_candidates']}: {report['recall_rescored']:.1%}")
+    print(
+        f"Index in RAM: {format_bytes(report['index_bytes'])} instead of {format_bytes(report['float_bytes'])} "
+        f"float32 ({format_bytes(report['bytes_saved'])} saved)"
+    )
+    print(f"On disk: {format_bytes(report['disk_bytes'])} (index, vectors.f32 and chunks.sqlite3)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quản lý chỉ mục tài liệu PDF")
+    parser.add_argument("--processor", choices=sorted(PROCESSORS), default="adaptive")
+    parser.add_argument("--pdf-folder", default="pdf_documents")
+    parser.add_argument("--db-directory", default="db")
+    parser.add_argument("--processed-files", default="processed_files.json")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch",
+                        help="Inference backend for the embedding model and reranker")
+    parser.add_argument("--search-mode", choices=["hybrid", "vector"], default="hybrid",
+                        help="Fuse BM25 with vector search, or use vectors only")
+    parser.add_argument("--vector-store", choices=["chroma", "faiss-flat", "faiss-hnsw", "faiss-ivfpq", "faiss-int8", "faiss-binary"],
+                        default="chroma", help="Chroma, or a FAISS index kept in <db-directory>/faiss")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="Process new or changed PDF files")
+    ingest.add_argument("--workers", type=int, default=1, help="Worker processes for extraction")
+    ingest.add_argument("--verify", action="store_true", help="Hash every file instead of trusting size/mtime/inode")
+    ingest.set_defaults(func=cmd_ingest)
+
+    watch = subparsers.add_parser("watch", help="Ingest PDFs as they are added, changed or deleted")
+    watch.add_argument("--interval", type=float, default=2.0, help="Seconds between folder scans")
+    watch.add_argument("--debounce", type=float, default=3.0, help="Seconds a file must stay unchanged before ingest")
+    watch.set_defaults(func=cmd_watch)
+
+    gc = subparsers.add_parser("gc", help="Purge orphaned vectors and compact the db directory")
+    gc.set_defaults(func=cmd_gc)
+
+    bench = subparsers.add_parser("bench-sessions", help="Measure RSS as sessions are added")
+    bench.add_argument("--sessions", type=int, default=5)
+    bench.add_argument("--mode", choices=["both", "shared", "per-session"], default="both",
+                       help="Share one processor (registry), build one per session, or compare both")
+    bench.set_defaults(func=cmd_bench_sessions)
+
+    bench_rerank = subparsers.add_parser("bench-rerank", help="Measure reranker throughput under concurrent queries")
+    bench_rerank.add_argument("--model", default="BAAI/bge-reranker-base")
+    bench_rerank.add_argument("--quantize", action="store_true")
+    bench_rerank.add_argument("--concurrency", type=int, default=8, help="Simultaneous queries")
+    bench_rerank.add_argument("--queries", type=int, default=40)
+    bench_rerank.add_argument("--passages", type=int, default=10, help="Candidates reranked per query")
+    bench_rerank.add_argument("--max-batch-size", type=int, default=32)
+    bench_rerank.add_argument("--max-wait-ms", type=float, default=10.0)
+    bench_rerank.set_defaults(func=cmd_bench_rerank)
+
+    bench_backend = subparsers.add_parser("bench-backend", help="Compare ONNX int8 against torch: accuracy and speed")
+    bench_backend.add_argument("--kind", choices=["embedding", "reranker"], default="embedding")
+    bench_backend.add_argument("--model", help="Defaults to the Vietnamese embedding model / reranker")
+    bench_backend.add_argument("--sentences", type=int, default=64)
+    bench_backend.add_argument("--repeats", type=int, default=3)
+    bench_backend.set_defaults(func=cmd_bench_backend)
+
+    profile = subparsers.add_parser("profile-startup", help="Import-time breakdown of app start-up, checked against a budget")
+    profile.add_argument("--budget", type=float, default=5.0, help="Maximum seconds to import the app's modules")
+    profile.add_argument("--with-models", action="store_true", help="Also time loading the processor's models")
+    profile.add_argument("--top", type=int, default=15, help="Number of modules to list")
+    profile.add_argument("--modules", help="Comma-separated modules to import instead of the app's")
+    profile.set_defaults(func=cmd_profile_startup)
+
+    bench_store = subparsers.add_parser("bench-vector-store", help="Compare vector stores: build time, latency, RSS")
+    bench_store.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated numbers of chunks")
+    bench_store.add_argument("--backends", default="chroma,faiss-flat,faiss-hnsw,faiss-ivfpq,faiss-int8,faiss-binary")
+    bench_store.add_argument("--dim", type=int, default=768, help="Vector size (768 for Vietnamese_Embedding_v2)")
+    bench_store.add_argument("--queries", type=int, default=200)
+    bench_store.set_defaults(func=cmd_bench_vector_store)
+
+    quantization = subparsers.add_parser("quantization-report", help="Recall@k and RAM saved by a quantized FAISS store")
+    quantization.add_argument("-k", type=int, default=5)
+    quantization.add_argument("--queries", type=int, default=100)
+    quantization.add_argument("--candidates", type=int, default=200, help="First-pass candidates rescored exactly")
+    quantization.set_defaults(func=cmd_quantization_report)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Process-wide registry of the heavy objects behind PDFProcessor.
+
+Streamlit runs every browser tab as its own session in the same process, so
+anything created in st.session_state is duplicated per tab. Embedding models,
+rerankers, vector stores, BM25 indexes, tokenizers and processors are created here once per process
+(per model / directory) and handed to every session instead.
+"""
+import os
+import time
+import threading
+import concurrent.futures
+
+_lock = threading.RLock()
+_embeddings = {}
+_rerankers = {}
+_rerank_services = {}
+_vector_stores = {}
+_sparse_indexes = {}
+_tokenizers = {}
+_tokenizer_locks = {}
+_context_packers = {}
+_processors = {}
+# Kept apart from _lock, which is held for the whole time a processor loads
+_loader_lock = threading.Lock()
+_processor_loaders = {}
+
+
+def get_embeddings(model_name, cache_dir="embedding_cache", backend="torch"):
+    """
+    Shared embedding model for `model_name`, wrapped in the persistent vector cache.
+    backend="onnx" runs an int8 ONNX Runtime export instead of PyTorch.
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from embedding_cache import CachedEmbeddings
+
+    key = (model_name, os.path.abspath(cache_dir), backend)
+    with _lock:
+        if key not in _embeddings:
+            if backend == "onnx":
+                from onnx_backend import export_onnx_model
+                model_dir, file_name = export_onnx_model(model_name, "embedding")
+                model = HuggingFaceEmbeddings(
+                    model_name=model_dir,
+                    model_kwargs={'backend': 'onnx', 'model_kwargs': {'file_name': file_name}}
+                )
+                # int8 vectors differ slightly from the torch ones, keep them apart in the cache
+                cache_name = f"{model_name}@onnx-int8"
+            else:
+                model = HuggingFaceEmbeddings(model_name=model_name)
+                cache_name = model_name
+            _embeddings[key] = CachedEmbeddings(model, cache_dir=cache_dir, model_name=cache_name)
+        return _embeddings[key]
+
+
+def get_reranker(model_name, quantize=False, warmup=True, backend="torch"):
+    """
+    Shared CrossEncoder for `model_name`, optionally dynamically quantized to int8
+    (backend="onnx" uses an int8 ONNX Runtime export and ignores `quantize`).
+    The first call loads it and runs a dummy batch through it so the first real
+    query doesn't pay for lazy initialisation. Returns None if the model can't
+    be loaded.
+    """
+    if backend == "onnx":
+        quantize = False
+    key = (model_name, quantize, backend)
+    with _lock:
+        if key in _rerankers:
+            return _rerankers[key]
+
+        start_time = time.time()
+        try:
+            from onnx_backend import load_cross_encoder
+            reranker = load_cross_encoder(model_name, backend)
+        except Exception as e:
+            print(f"Error loading reranker: {str(e)}")
+            return None
+
+        if quantize:
+            try:
+                import torch
+                if hasattr(torch, 'quantization') and hasattr(reranker.model, 'to'):
+                    reranker.model = torch.quantization.quantize_dynamic(
+                        reranker.model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                    print("Successfully quantized reranker model")
+            except Exception as e:
+                print(f"Quantization not supported: {str(e)}")
+
+        load_time = time.time() - start_time
+
+        if warmup:
+            start_time = time.time()
+            try:
+                reranker.predict([("khởi động", "khởi động mô hình xếp hạng lại")] * 4)
+            except Exception as e:
+                print(f"Reranker warm-up failed: {str(e)}")
+            print(f"Loaded reranker {model_name} in {load_time:.2f}s (warm-up {time.time() - start_time:.2f}s)")
+        else:
+            print(f"Loaded reranker {model_name} in {load_time:.2f}s")
+
+        _rerankers[key] = reranker
+        return reranker
+
+
+def get_rerank_service(model_name, quantize=False, max_batch_size=32, max_wait=0.01, backend="torch"):
+    """
+    Shared micro-batching service in front of the reranker for `model_name`, so
+    pairs from every concurrent query go through one predict per time window.
+    Returns None if the reranker can't be loaded.
+    """
+    from rerank_service import RerankService
+
+    key = (model_name, quantize, backend)
+    with _lock:
+        service = _rerank_services.get(key)
+        if service is None:
+            reranker = get_reranker(model_name, quantize=quantize, backend=backend)
+            if reranker is None:
+                return None
+            service = RerankService(reranker, max_batch_size=max_batch_size, max_wait=max_wait)
+            _rerank_services[key] = service
+        return service
+
+
+def get_vector_store(db_directory, embeddings, client_settings=None, backend="chroma"):
+    """
+    Shared vector store for `db_directory` using `embeddings`: Chroma, or a FAISS
+    index ("faiss-flat", "faiss-hnsw", "faiss-ivfpq") kept under db_directory/faiss.
+    """
+    from vector_stores import create_vector_store
+
+    if backend == "chroma":
+        key = (os.path.abspath(db_directory), id(embeddings), client_settings is not None, backend)
+    else:
+        # FAISS gets precomputed vectors only, so all processors on the directory share it
+        key = (os.path.abspath(db_directory), backend)
+    with _lock:
+        if key not in _vector_stores:
+            _vector_stores[key] = create_vector_store(backend, db_directory, embeddings, client_settings)
+        return _vector_stores[key]
+
+
+def get_sparse_index(path):
+    """Shared BM25 index stored at `path`"""
+    from bm25_index import BM25Index
+
+    key = os.path.abspath(path)
+    with _lock:
+        if key not in _sparse_indexes:
+            _sparse_indexes[key] = BM25Index(path)
+        return _sparse_indexes[key]
+
+
+def get_tokenizer(model_name):
+    """Shared Hugging Face tokenizer for `model_name`, or None if it can't be loaded"""
+    # Loading may download the tokenizer, so it holds a lock of its own instead of _lock:
+    # a chat turn shouldn't wait for the processor's models to load, nor the other way round
+    with _loader_lock:
+        lock = _tokenizer_locks.setdefault(model_name, threading.Lock())
+    with lock:
+        if model_name not in _tokenizers:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizers[model_name] = AutoTokenizer.from_pretrained(model_name)
+            except Exception as e:
+                print(f"Error loading tokenizer {model_name}, estimating tokens from characters: {str(e)}")
+                _tokenizers[model_name] = None
+        return _tokenizers[model_name]
+
+
+def get_context_packer(token_budget, tokenizer_name=None):
+    """Shared ContextPacker (and its token count cache) per budget and tokenizer"""
+    from context_packer import ContextPacker
+
+    key = (token_budget, tokenizer_name)
+    with _lock:
+        if key not in _context_packers:
+            _context_packers[key] = ContextPacker(token_budget, tokenizer_name)
+        return _context_packers[key]
+
+
+def get_processor(processor_class, **kwargs):
+    """
+    One processor per (class, arguments) for the whole process, so every session
+    shares its processed_files list, ingest lock and caches.
+    """
+    key = (processor_class.__module__, processor_class.__qualname__, tuple(sorted(kwargs.items())))
+    with _lock:
+        if key not in _processors:
+            _processors[key] = processor_class(**kwargs)
+        return _processors[key]
+
+
+def clear_registry():
+    """
+    Forget every shared object so the next calls create new ones; objects already
+    handed out stay alive while something references them. Used by
+    `manage.py bench-sessions` to measure one set of models per session.
+    """
+    with _lock:
+        for shared in (_embeddings, _rerankers, _rerank_services, _vector_stores, _sparse_indexes,
+                       _tokenizers, _context_packers, _processors):
+            shared.clear()
+    # These two are guarded by _loader_lock rather than _lock
+    with _loader_lock:
+        _tokenizer_locks.clear()
+        _processor_loaders.clear()
+
+
+def load_processor_in_background(processor_class, **kwargs):
+    """
+    Build the shared processor (and load its models) on a background thread.
+    Returns a concurrent.futures.Future for it right away, so the UI can be
+    drawn while the models load. A failed load is retried on the next call.
+    """
+    key = (processor_class.__module__, processor_class.__qualname__, tuple(sorted(kwargs.items())))
+    with _loader_lock:
+        future = _processor_loaders.get(key)
+        if future is None or (future.done() and future.exception() is not None):
+            future = concurrent.futures.Future()
+            _processor_loaders[key] = future
+
+            def load():
+                start_time = time.time()
+                try:
+                    future.set_result(get_processor(processor_class, **kwargs))
+                    print(f"Loaded {processor_class.__name__} in {time.time() - start_time:.2f}s")
+                except Exception as e:
+                    print(f"Error loading {processor_class.__name__}: {str(e)}")
+                    future.set_exception(e)
+
+            threading.Thread(target=load, name="processor-loader", daemon=True).start()
+        return future
+
+
+def get_rss_bytes():
+    """Resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is the peak, in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
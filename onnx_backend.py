@@ -0,0 +1,143 @@
+"""
+ONNX Runtime int8 backend for the embedding model and the reranker.
+
+The first time a model is requested it is exported to ONNX through
+sentence-transformers (needs `optimum[onnxruntime]`), its Linear layers are
+dynamically quantized to int8 for the current CPU (arm64 on the Orange Pi,
+avx2 elsewhere) and the result is kept under `onnx_models/` so later starts
+load it directly.
+"""
+import os
+import time
+import platform
+
+BACKENDS = ("torch", "onnx")
+
+
+def quantization_config():
+    """Dynamic quantization preset matching this CPU"""
+    machine = platform.machine().lower()
+    if machine in ("aarch64", "arm64"):
+        return "arm64"
+    return "avx2"
+
+
+def _export_dir(model_name, export_root):
+    return os.path.join(export_root, model_name.replace("/", "__"))
+
+
+def export_onnx_model(model_name, kind="embedding", export_root="onnx_models"):
+    """
+    Export `model_name` (a SentenceTransformer, or a CrossEncoder when kind is
+    "reranker") to ONNX with int8 weights if it hasn't been already.
+    Returns (model_dir, file_name) to load it with backend="onnx".
+    """
+    config = quantization_config()
+    model_dir = _export_dir(model_name, export_root)
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    if os.path.exists(os.path.join(model_dir, file_name)):
+        return model_dir, file_name
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    if kind == "reranker":
+        from sentence_transformers import CrossEncoder as model_class
+    else:
+        from sentence_transformers import SentenceTransformer as model_class
+
+    start_time = time.time()
+    print(f"Exporting {model_name} to ONNX ({config} int8)...")
+    model = model_class(model_name, backend="onnx")
+    model.save(model_dir)
+    export_dynamic_quantized_onnx_model(model, config, model_dir)
+    print(f"Exported {model_name} to {model_dir} in {time.time() - start_time:.2f}s")
+    return model_dir, file_name
+
+
+def load_sentence_transformer(model_name, backend="torch", export_root="onnx_models"):
+    """Plain SentenceTransformer for `backend`, used for the accuracy check and benchmark"""
+    from sentence_transformers import SentenceTransformer
+    if backend == "onnx":
+        model_dir, file_name = export_onnx_model(model_name, "embedding", export_root)
+        return SentenceTransformer(model_dir, backend="onnx", model_kwargs={"file_name": file_name})
+    return SentenceTransformer(model_name)
+
+
+def load_cross_encoder(model_name, backend="torch", export_root="onnx_models"):
+    from sentence_transformers import CrossEncoder
+    if backend == "onnx":
+        model_dir, file_name = export_onnx_model(model_name, "reranker", export_root)
+        return CrossEncoder(model_dir, backend="onnx", model_kwargs={"file_name": file_name})
+    return CrossEncoder(model_name)
+
+
+def _throughput(fn, items, repeats):
+    fn(items[:4])  # warm-up
+    start_time = time.time()
+    for _ in range(repeats):
+        outputs = fn(items)
+    return outputs, len(items) * repeats / (time.time() - start_time)
+
+
+def compare_embedding_backends(model_name, sentences, repeats=3, export_root="onnx_models"):
+    """
+    Embed `sentences` with torch and with the ONNX int8 export. Reports the cosine
+    similarity between both vectors of each sentence, whether nearest neighbours
+    agree, and sentences per second for each backend.
+    """
+    import numpy as np
+
+    torch_model = load_sentence_transformer(model_name, "torch", export_root)
+    onnx_model = load_sentence_transformer(model_name, "onnx", export_root)
+
+    def encoder(model):
+        return lambda items: model.encode(items, normalize_embeddings=True, convert_to_numpy=True)
+
+    torch_vectors, torch_rate = _throughput(encoder(torch_model), sentences, repeats)
+    onnx_vectors, onnx_rate = _throughput(encoder(onnx_model), sentences, repeats)
+
+    cosine = np.sum(torch_vectors * onnx_vectors, axis=1)
+    # Each sentence's nearest other sentence should be the same under both backends
+    torch_sim = torch_vectors @ torch_vectors.T
+    onnx_sim = onnx_vectors @ onnx_vectors.T
+    np.fill_diagonal(torch_sim, -np.inf)
+    np.fill_diagonal(onnx_sim, -np.inf)
+    neighbour_agreement = float(np.mean(torch_sim.argmax(axis=1) == onnx_sim.argmax(axis=1)))
+
+    return {
+        'min_cosine': float(cosine.min()),
+        'mean_cosine': float(cosine.mean()),
+        'neighbour_agreement': neighbour_agreement,
+        'torch_per_sec': torch_rate,
+        'onnx_per_sec': onnx_rate,
+    }
+
+
+def compare_reranker_backends(model_name, query, passages, repeats=3, export_root="onnx_models"):
+    """
+    Score (query, passage) pairs with torch and with the ONNX int8 export. Reports
+    the largest score difference, whether the top passage and the top-5 set agree,
+    and pairs per second for each backend.
+    """
+    import numpy as np
+
+    torch_model = load_cross_encoder(model_name, "torch", export_root)
+    onnx_model = load_cross_encoder(model_name, "onnx", export_root)
+    pairs = [(query, passage) for passage in passages]
+
+    def scorer(model):
+        return lambda items: np.asarray(model.predict(items))
+
+    torch_scores, torch_rate = _throughput(scorer(torch_model), pairs, repeats)
+    onnx_scores, onnx_rate = _throughput(scorer(onnx_model), pairs, repeats)
+
+    top_n = min(5, len(pairs))
+    torch_top = set(np.argsort(-torch_scores)[:top_n])
+    onnx_top = set(np.argsort(-onnx_scores)[:top_n])
+
+    return {
+        'max_abs_diff': float(np.max(np.abs(torch_scores - onnx_scores))),
+        'top1_agree': bool(np.argmax(torch_scores) == np.argmax(onnx_scores)),
+        'top5_overlap': len(torch_top & onnx_top) / top_n,
+        'torch_per_sec': torch_rate,
+        'onnx_per_sec': onnx_rate,
+    }
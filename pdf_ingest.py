@@ -0,0 +1,349 @@
+import re
+import time
+import queue
+import hashlib
+import threading
+import collections
+import multiprocessing
+import concurrent.futures
+from pdf_loaders import load_pdf
+
+
+def assign_chunk_ids(splits, file_name):
+    """
+    Give every chunk a deterministic ID derived from its file name and text, so
+    re-ingesting the same content maps onto the same vector store entries.
+    Identical chunks inside one file get an occurrence suffix. The page number is
+    deliberately left out so chunks keep their ID when pages shift around them.
+    """
+    seen = collections.Counter()
+    ids = []
+    for doc in splits:
+        digest = hash_text(f"{file_name}\x00{doc.page_content}")
+        seen[digest] += 1
+        chunk_id = digest if seen[digest] == 1 else f"{digest}-{seen[digest]}"
+        doc.metadata["chunk_id"] = chunk_id
+        ids.append(chunk_id)
+    return ids
+
+
+def hash_text(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def changed_pages(old_page_hashes, new_page_hashes):
+    """1-based numbers of pages whose text differs from the previous version"""
+    old_page_hashes = old_page_hashes or []
+    return [
+        i + 1 for i, page_hash in enumerate(new_page_hashes)
+        if i >= len(old_page_hashes) or old_page_hashes[i] != page_hash
+    ]
+
+
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_TRAILING_SPACE = re.compile(r"[ \t]+\n")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def clean_documents(documents):
+    """Strip control characters and runs of blank lines that text layers and OCR leave behind"""
+    for doc in documents:
+        text = _CONTROL_CHARS.sub("", doc.page_content)
+        text = _TRAILING_SPACE.sub("\n", text)
+        doc.page_content = _BLANK_LINES.sub("\n\n", text)
+    return documents
+
+
+def extract_pdf(file_name, pdf_path, language="vie"):
+    """
+    Load a single PDF page by page. Runs inside a worker process, so it only
+    touches the loaders - splitting, embedding and storage stay in the parent.
+    """
+    start_time = time.time()
+    documents, is_scanned = load_pdf(pdf_path, file_name, language=language)
+
+    return {
+        'file': file_name,
+        'path': pdf_path,
+        'documents': documents,
+        'is_scanned': is_scanned,
+        'ocr_pages': sum(1 for doc in documents if doc.metadata.get("processing_method") == "ocr"),
+        'extract_time': time.time() - start_time,
+    }
+
+
+def report_throughput(result, embed_time, num_added=None, num_removed=0):
+    """Print per-file ingestion throughput"""
+    num_pages = len(result['documents'])
+    total_time = result['extract_time'] + embed_time
+    pages_per_sec = num_pages / total_time if total_time > 0 else 0.0
+    if num_added is None:
+        num_added = len(result['splits'])
+    print(
+        f"Processed {result['file']}: {num_pages} pages, {len(result['splits'])} chunks "
+        f"({num_added} embedded, {num_removed} stale removed; "
+        f"extract {result['extract_time']:.2f}s, embed {embed_time:.2f}s, "
+        f"{pages_per_sec:.1f} pages/s)"
+    )
+
+
+class IngestProgress:
+    """Thread-safe ingest counters that a UI can poll while process_pdfs runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = "idle"
+        self.total_files = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.pages_done = 0
+        self.chunks_done = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def start(self, total_files):
+        with self._lock:
+            self.status = "running"
+            self.total_files = total_files
+            self.files_done = self.files_failed = self.pages_done = self.chunks_done = 0
+            self.started_at = time.time()
+            self.finished_at = None
+
+    def file_done(self, num_pages, num_chunks):
+        with self._lock:
+            self.files_done += 1
+            self.pages_done += num_pages
+            self.chunks_done += num_chunks
+
+    def file_failed(self):
+        with self._lock:
+            self.files_failed += 1
+
+    def finish(self, status="done"):
+        with self._lock:
+            self.status = status
+            self.finished_at = time.time()
+
+    def snapshot(self):
+        """Files done, pages per second and an ETA (seconds, None until a file is done)"""
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            finished = self.files_done + self.files_failed
+            remaining = max(self.total_files - finished, 0)
+            eta = elapsed / finished * remaining if finished and self.status == "running" else None
+            return {
+                'status': self.status,
+                'total_files': self.total_files,
+                'files_done': self.files_done,
+                'files_failed': self.files_failed,
+                'pages_done': self.pages_done,
+                'chunks_done': self.chunks_done,
+                'elapsed': elapsed,
+                'pages_per_sec': self.pages_done / elapsed if elapsed > 0 else 0.0,
+                'eta': eta,
+            }
+
+
+_DONE = object()
+
+
+class _Stage:
+    """A pool of threads moving items from one bounded queue to the next"""
+
+    def __init__(self, name, func, workers, input_queue, output_queue):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.processed = 0
+        self.busy_time = 0.0
+        self._running = workers
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f"ingest-{self.name}-{i}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            item = self.input_queue.get()
+            if item is _DONE:
+                # Let the other workers of this stage see it too
+                self.input_queue.put(_DONE)
+                break
+
+            if 'error' not in item:
+                start_time = time.time()
+                try:
+                    item = self.func(item)
+                except Exception as e:
+                    item['error'] = str(e)
+                with self._lock:
+                    self.busy_time += time.time() - start_time
+                    self.processed += 1
+            self.output_queue.put(item)
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            self.output_queue.put(_DONE)
+
+
+class IngestPipeline:
+    """
+    Staged ingest pipeline: extract -> clean -> split -> plan/embed -> write.
+
+    Stages are connected by bounded queues so only a few files are in flight
+    between any two stages, and each stage has its own concurrency: extraction
+    runs in a process pool (`extract_workers`), splitting on `split_workers`
+    threads, embedding on one thread in batches of `embed_batch_size`, and the
+    write stage runs on the calling thread so the vector store has a single
+    writer. A large corpus then ingests at the speed of the slowest stage
+    instead of the sum of all of them.
+
+    `plan(file, splits)` returns the vector store changes for a file (see
+    PDFProcessor._plan_file_chunks), `embed(texts)` embeds the chunks the plan
+    adds and `commit(result, vectors)` writes them and records the file.
+    `progress` (an IngestProgress) is updated after every committed file.
+    """
+
+    STAGES = ["extract", "clean", "split", "embed", "write"]
+
+    def __init__(self, text_splitter, plan, embed, commit, extract_workers=1, split_workers=1,
+                 embed_batch_size=64, queue_size=None, language="vie", report_interval=10.0,
+                 progress=None):
+        self.text_splitter = text_splitter
+        self.plan = plan
+        self.embed = embed
+        self.commit = commit
+        self.extract_workers = max(1, extract_workers)
+        self.split_workers = max(1, split_workers)
+        self.embed_batch_size = embed_batch_size
+        self.queue_size = queue_size or 2 * self.extract_workers
+        self.language = language
+        self.report_interval = report_interval
+        self.progress = progress or IngestProgress()
+        self._executor = None
+        self._queues = {}
+
+    def _extract(self, item):
+        if self._executor is None:
+            result = extract_pdf(item['file'], item['path'], self.language)
+        else:
+            result = self._executor.submit(extract_pdf, item['file'], item['path'], self.language).result()
+        result['start_time'] = item['start_time']
+        return result
+
+    def _clean(self, item):
+        clean_documents(item['documents'])
+        item['page_hashes'] = [hash_text(doc.page_content) for doc in item['documents']]
+        return item
+
+    def _split(self, item):
+        item['splits'] = self.text_splitter.split_documents(item['documents'])
+        assign_chunk_ids(item['splits'], item['file'])
+        return item
+
+    def _embed(self, item):
+        item['plan'] = self.plan(item['file'], item['splits'])
+        texts = [doc.page_content for doc in item['plan']['add']]
+        start_time = time.time()
+        vectors = []
+        for i in range(0, len(texts), self.embed_batch_size):
+            vectors.extend(self.embed(texts[i:i + self.embed_batch_size]))
+        item['vectors'] = vectors
+        item['embed_time'] = time.time() - start_time
+        return item
+
+    def queue_depths(self):
+        """Number of files waiting in front of each stage"""
+        return {name: q.qsize() for name, q in self._queues.items()}
+
+    def _monitor(self, stop_event):
+        while not stop_event.wait(self.report_interval):
+            depths = ", ".join(f"{name} {depth}" for name, depth in self.queue_depths().items())
+            print(f"Ingest queue depth: {depths}")
+
+    def run(self, pending):
+        """
+        Ingest the (file_name, pdf_path) pairs in `pending`.
+        Returns the number of files committed; failed files are reported and skipped.
+        """
+        self.progress.start(len(pending))
+        if not pending:
+            self.progress.finish()
+            return 0
+
+        self._queues = {name: queue.Queue(maxsize=self.queue_size) for name in self.STAGES}
+        queues = [self._queues[name] for name in self.STAGES]
+
+        if self.extract_workers > 1 and len(pending) > 1:
+            print(f"Extracting {len(pending)} PDF files with {self.extract_workers} workers")
+            # spawn: the parent already holds torch/Chroma threads, which don't survive fork
+            context = multiprocessing.get_context("spawn")
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(self.extract_workers, len(pending)), mp_context=context
+            )
+
+        stages = [
+            _Stage("extract", self._extract, self.extract_workers, queues[0], queues[1]),
+            _Stage("clean", self._clean, 1, queues[1], queues[2]),
+            _Stage("split", self._split, self.split_workers, queues[2], queues[3]),
+            _Stage("embed", self._embed, 1, queues[3], queues[4]),
+        ]
+        for stage in stages:
+            stage.start()
+
+        def feed():
+            for file_name, pdf_path in pending:
+                queues[0].put({'file': file_name, 'path': pdf_path, 'start_time': time.time()})
+            queues[0].put(_DONE)
+
+        stop_event = threading.Event()
+        threading.Thread(target=feed, name="ingest-feed", daemon=True).start()
+        threading.Thread(target=self._monitor, args=(stop_event,), name="ingest-monitor", daemon=True).start()
+
+        committed = 0
+        write_time = 0.0
+        try:
+            # Write stage: the calling thread is the only vector store writer
+            while True:
+                item = queues[4].get()
+                if item is _DONE:
+                    break
+                if 'error' in item:
+                    print(f"Error processing file {item['file']}: {item['error']}")
+                    self.progress.file_failed()
+                    continue
+                start_time = time.time()
+                try:
+                    self.commit(item, item.pop('vectors'))
+                except Exception as e:
+                    print(f"Error processing file {item['file']}: {str(e)}")
+                    self.progress.file_failed()
+                    continue
+                write_time += time.time() - start_time
+                committed += 1
+                self.progress.file_done(len(item['documents']), len(item['splits']))
+                report_throughput(
+                    item, item['embed_time'], len(item['plan']['add']), len(item['plan']['stale'])
+                )
+        except BaseException:
+            self.progress.finish("failed")
+            raise
+        finally:
+            stop_event.set()
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+        summary = ", ".join(
+            f"{stage.name} {stage.processed} files in {stage.busy_time:.1f}s (x{stage.workers})"
+            for stage in stages
+        )
+        print(f"Ingest stages: {summary}, write {committed} files in {write_time:.1f}s")
+        self.progress.finish()
+        return committed
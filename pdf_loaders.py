@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import io
+import os
+import subprocess
+import collections
+import concurrent.futures
+from typing import Iterator, List, TYPE_CHECKING
+
+# fitz, pdf2image, pytesseract and langchain are imported where they are used:
+# importing the processors (e.g. when the app starts with the index already
+# built) should not pay for PDF and OCR libraries that may never be needed.
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+
+class StreamingOCRPDFLoader:
+    """
+    OCR loader that renders a few pages at a time instead of the whole file.
+
+    Pages are rasterised in windows of `window_size`, OCR'd on a bounded thread
+    pool (Tesseract runs as a subprocess, so threads do run in parallel) and
+    yielded in page order. At most two windows of images are alive at once, so
+    peak memory does not depend on the page count.
+    """
+
+    def __init__(self, file_path: str, language: str = "vie", workers: int = None,
+                 window_size: int = 4, dpi: int = 200, pages: List[int] = None):
+        self.file_path = file_path
+        self.language = language
+        self.workers = workers or max(1, min(4, os.cpu_count() or 1))
+        self.window_size = max(window_size, self.workers)
+        self.dpi = dpi
+        # 1-based page numbers to OCR; None means every page
+        self.pages = pages
+
+    def _ocr_page(self, image):
+        import pytesseract
+        try:
+            if self.workers == 1:
+                return pytesseract.image_to_string(image, lang=self.language)
+            # Each Tesseract process would otherwise start its own OpenMP threads. pytesseract
+            # can't pass an environment to its subprocess, so run it directly with the limit
+            # set for that process only, leaving the app's own environment untouched
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            env = dict(os.environ)
+            env.setdefault("OMP_THREAD_LIMIT", "1")
+            result = subprocess.run(
+                [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout", "-l", self.language],
+                input=buffer.getvalue(), capture_output=True, env=env
+            )
+            if result.returncode != 0:
+                raise pytesseract.TesseractError(result.returncode, result.stderr.decode("utf-8", "replace"))
+            return result.stdout.decode("utf-8")
+        finally:
+            image.close()
+
+    def _make_document(self, page_number, text, total_pages):
+        from langchain_core.documents import Document
+        return Document(
+            page_content=text,
+            metadata={
+                "source": self.file_path,
+                "page": page_number,
+                "total_pages": total_pages,
+                "processing_method": "ocr"
+            }
+        )
+
+    def _render(self, page_numbers):
+        """Rasterise the given pages, one pdftoppm call per run of consecutive pages"""
+        import pdf2image
+        rendered = []
+        run_start = 0
+        for i in range(1, len(page_numbers) + 1):
+            if i == len(page_numbers) or page_numbers[i] != page_numbers[i - 1] + 1:
+                images = pdf2image.convert_from_path(
+                    self.file_path, dpi=self.dpi,
+                    first_page=page_numbers[run_start], last_page=page_numbers[i - 1]
+                )
+                rendered.extend(zip(page_numbers[run_start:i], images))
+                run_start = i
+        return rendered
+
+    def lazy_load(self) -> Iterator[Document]:
+        """Yield one Document per page, in page order."""
+        import pdf2image
+        total_pages = pdf2image.pdfinfo_from_path(self.file_path)["Pages"]
+        page_numbers = sorted(self.pages) if self.pages is not None else list(range(1, total_pages + 1))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = collections.deque()
+            for start in range(0, len(page_numbers), self.window_size):
+                window = page_numbers[start:start + self.window_size]
+                for page_number, image in self._render(window):
+                    pending.append((page_number, executor.submit(self._ocr_page, image)))
+
+                # Render the next window while this one is being OCR'd
+                while len(pending) > self.window_size:
+                    page_number, future = pending.popleft()
+                    yield self._make_document(page_number, future.result(), total_pages)
+
+            while pending:
+                page_number, future = pending.popleft()
+                yield self._make_document(page_number, future.result(), total_pages)
+
+    def load(self) -> List[Document]:
+        """Load PDF and convert to text using OCR."""
+        return list(self.lazy_load())
+
+
+class HybridPDFLoader:
+    """
+    Loader that decides per page between the PDF text layer and OCR.
+
+    Pages whose PyMuPDF text layer has at least `min_text_chars` characters are
+    used as is; pages with little or no text but with something drawn on them
+    (scanned images, inline images, or text converted to vector outlines) are
+    sent to Tesseract. Each Document records its own
+    `processing_method` ("text" or "ocr"), so a typed report with scanned
+    appendices only pays OCR cost for the appendices.
+    """
+
+    def __init__(self, file_path: str, language: str = "vie", min_text_chars: int = 100,
+                 ocr_workers: int = None):
+        self.file_path = file_path
+        self.language = language
+        self.min_text_chars = min_text_chars
+        self.ocr_workers = ocr_workers
+
+    @staticmethod
+    def _has_drawn_content(page):
+        """Whether the page shows anything OCR could read besides its text layer"""
+        # get_images() only lists image XObjects; get_image_info() also sees inline images
+        return bool(page.get_images() or page.get_image_info() or page.get_drawings())
+
+    def load(self) -> List[Document]:
+        """Load PDF, using the text layer where one exists and OCR elsewhere."""
+        import fitz  # PyMuPDF
+        from langchain_core.documents import Document
+
+        doc = fitz.open(self.file_path)
+        total_pages = len(doc)
+        texts = {}
+        ocr_pages = []
+        try:
+            for page_index, page in enumerate(doc):
+                page_number = page_index + 1
+                text = page.get_text()
+                # Blank pages have nothing for OCR to find either
+                if len(text.strip()) < self.min_text_chars and self._has_drawn_content(page):
+                    ocr_pages.append(page_number)
+                else:
+                    texts[page_number] = text
+        finally:
+            doc.close()
+
+        if ocr_pages:
+            ocr_loader = StreamingOCRPDFLoader(
+                self.file_path, language=self.language, workers=self.ocr_workers, pages=ocr_pages
+            )
+            for ocr_doc in ocr_loader.lazy_load():
+                texts[ocr_doc.metadata["page"]] = ocr_doc.page_content
+
+        ocr_page_set = set(ocr_pages)
+        return [
+            Document(
+                page_content=texts[page_number],
+                metadata={
+                    "source": self.file_path,
+                    "page": page_number,
+                    "total_pages": total_pages,
+                    "processing_method": "ocr" if page_number in ocr_page_set else "text"
+                }
+            )
+            for page_number in range(1, total_pages + 1)
+        ]
+
+
+def load_pdf(pdf_path, file_name, language="vie"):
+    """
+    Load a PDF page by page, taking text from the PDF text layer where there is one
+    and OCR'ing only the pages without it.
+    Returns (documents, is_scanned); is_scanned is True when every page needed OCR.
+    """
+    documents = HybridPDFLoader(pdf_path, language=language).load()
+    ocr_pages = sum(1 for doc in documents if doc.metadata["processing_method"] == "ocr")
+    is_scanned = len(documents) > 0 and ocr_pages == len(documents)
+
+    if ocr_pages:
+        print(f"Detected {ocr_pages}/{len(documents)} scanned pages in {file_name}, using OCR for those pages")
+    else:
+        print(f"Detected normal PDF: {file_name}, using PyMuPDF processing")
+
+    # Add metadata to help with retrieval
+    for doc in documents:
+        doc.metadata["file_name"] = file_name
+        doc.metadata["source"] = pdf_path
+        doc.metadata["is_scanned"] = doc.metadata["processing_method"] == "ocr"
+
+    return documents, is_scanned
@@ -1,217 +1,13 @@
-import os
-import hashlib
-import json
-import fitz  # PyMuPDF
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import PyMuPDFLoader, UnstructuredPDFLoader
-from langchain.schema import Document
-from datetime import datetime
-import pdf2image
-import pytesseract
-from typing import List
-import concurrent.futures
-from chromadb.config import Settings
+import time
+from pdf_processor_base import BasePDFProcessor
+from model_registry import get_vector_store, get_rerank_service
+from bm25_index import code_tokens
+from result_selection import adaptive_cutoff
+from semantic_cache import SemanticQueryCache
 
-class CustomOCRPDFLoader:
-    """Custom loader for OCR processing of PDFs using Tesseract."""
-    
-    def __init__(self, file_path: str, language: str = "vie"):
-        self.file_path = file_path
-        self.language = language
-    
-    def load(self) -> List[Document]:
-        """Load PDF and convert to text using OCR."""
-        # Convert PDF to images
-        images = pdf2image.convert_from_path(self.file_path)
-        
-        documents = []
-        for i, image in enumerate(images):
-            # Use pytesseract to extract text with Vietnamese language support
-            text = pytesseract.image_to_string(image, lang=self.language)
-            
-            # Create a Document for each page
-            doc = Document(
-                page_content=text,
-                metadata={
-                    "source": self.file_path,
-                    "page": i + 1,
-                    "total_pages": len(images),
-                    "processing_method": "ocr"
-                }
-            )
-            documents.append(doc)
-        
-        return documents
-
-
-class PDFProcessor:
-    def __init__(self, pdf_folder="pdf_documents", db_directory="db", processed_files_path="processed_files.json"):
-        self.pdf_folder = pdf_folder
-        self.db_directory = db_directory
-        self.processed_files_path = processed_files_path
-        
-        # Sử dụng thanhtantran/Vietnamese_Embedding_v2 làm model embedding
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="thanhtantran/Vietnamese_Embedding_v2"
-        )
-        
-        # Improved text splitting for better context preservation
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1500,
-            chunk_overlap=300,
-            separators=["\n\n", "\n", " ", ""],
-            length_function=len
-        )
-        
-        self.db = None
-        
-        # Create directories if they don't exist
-        os.makedirs(pdf_folder, exist_ok=True)
-        os.makedirs(db_directory, exist_ok=True)
-        
-        # Load processed files list
-        self.processed_files = self._load_processed_files()
-        
-        # Initialize or load vector store
-        self._initialize_db()
-
-    def _get_file_hash(self, filepath):
-        """Calculate file hash to check for changes"""
-        hasher = hashlib.md5()
-        with open(filepath, 'rb') as f:
-            buf = f.read(65536)
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = f.read(65536)
-        return hasher.hexdigest()
-
-    def _load_processed_files(self):
-        """Load list of processed files"""
-        if os.path.exists(self.processed_files_path):
-            with open(self.processed_files_path, 'r') as f:
-                return json.load(f)
-        return {}
-
-    def _save_processed_files(self):
-        """Save list of processed files"""
-        with open(self.processed_files_path, 'w') as f:
-            json.dump(self.processed_files, f, indent=2)
-
-    def _initialize_db(self):
-        """Initialize or load vector store"""
-        if os.path.exists(self.db_directory):
-            self.db = Chroma(
-                persist_directory=self.db_directory,
-                embedding_function=self.embeddings
-            )
-        else:
-            self.db = Chroma(
-                persist_directory=self.db_directory,
-                embedding_function=self.embeddings
-            )
-    
-    def _is_scanned_pdf(self, pdf_path):
-        """
-        Check if a PDF is likely a scanned document by examining text content.
-        Returns True if likely scanned, False otherwise.
-        """
-        try:
-            # Open the PDF with PyMuPDF
-            doc = fitz.open(pdf_path)
-            total_pages = len(doc)
-            text_content = 0
-            
-            # Check first few pages (up to 5 or total pages, whichever is less)
-            pages_to_check = min(5, total_pages)
-            
-            for page_num in range(pages_to_check):
-                page = doc[page_num]
-                text = page.get_text()
-                text_content += len(text)
-            
-            doc.close()
-            
-            # Calculate average text per page
-            avg_text_per_page = text_content / pages_to_check
-            
-            # If very little text is found, it's likely a scanned document
-            # Threshold can be adjusted based on your documents
-            return avg_text_per_page < 100
-            
-        except Exception as e:
-            print(f"Error checking if PDF is scanned: {str(e)}")
-            # Default to non-scanned if we can't determine
-            return False
-
-    def process_pdfs(self):
-        """Process new or changed PDF files with adaptive loader selection"""
-        new_files_processed = False
-        
-        # Check each file in directory
-        for file in os.listdir(self.pdf_folder):
-            if file.endswith('.pdf'):
-                pdf_path = os.path.join(self.pdf_folder, file)
-                try:
-                    current_hash = self._get_file_hash(pdf_path)
-                
-                    # Check if file has been processed or changed
-                    if (file not in self.processed_files or 
-                        self.processed_files[file]['hash'] != current_hash):
-                        
-                        print(f"Processing new file: {file}")
-                        
-                        # Determine if the PDF is scanned
-                        is_scanned = self._is_scanned_pdf(pdf_path)
-                        
-                        if is_scanned:
-                            print(f"Detected scanned document: {file}, using OCR processing")
-                            # Use our custom OCR loader for scanned documents
-                            loader = CustomOCRPDFLoader(
-                                pdf_path,
-                                language="vie"  # Vietnamese language code for Tesseract
-                            )
-                        else:
-                            print(f"Detected normal PDF: {file}, using PyMuPDF processing")
-                            # Use PyMuPDFLoader for regular PDFs
-                            loader = PyMuPDFLoader(pdf_path)
-                        
-                        documents = loader.load()
-                        
-                        # Add metadata to help with retrieval
-                        for doc in documents:
-                            doc.metadata["file_name"] = file
-                            doc.metadata["source"] = pdf_path
-                            doc.metadata["is_scanned"] = is_scanned
-                        
-                        # Split into chunks
-                        splits = self.text_splitter.split_documents(documents)
-                        
-                        # Add to vector store
-                        self.db.add_documents(splits)
-                        
-                        # Update processed file info
-                        self.processed_files[file] = {
-                            'hash': current_hash,
-                            'processed_date': datetime.now().isoformat(),
-                            'num_pages': len(documents),
-                            'num_chunks': len(splits),
-                            'is_scanned': is_scanned
-                        }
-                    
-                        new_files_processed = True
-                except Exception as e:
-                    print(f"Error processing file {file}: {str(e)}")
-        
-        # Save processed files info
-        if new_files_processed:
-            self._save_processed_files()
-            print("Completed processing new PDF files")
-
-    def search_similar(self, query, k=5):
-        """Search for similar text passages"""
-        return self.db.similarity_search(query, k=k)
+class PDFProcessor(BasePDFProcessor):
+    # Sử dụng thanhtantran/Vietnamese_Embedding_v2 làm model embedding
+    embedding_model = "thanhtantran/Vietnamese_Embedding_v2"
 
 
 class AdaptivePDFProcessor(PDFProcessor):
@@ -219,72 +15,68 @@ class AdaptivePDFProcessor(PDFProcessor):
     Phiên bản nâng cao của PDFProcessor với khả năng tự động điều chỉnh chiến lược tìm kiếm
     dựa trên độ phức tạp của câu hỏi và độ tin cậy của kết quả.
     """
-    def __init__(self, pdf_folder="pdf_documents", db_directory="db", processed_files_path="processed_files.json"):
-        super().__init__(pdf_folder, db_directory, processed_files_path)
+    def __init__(self, pdf_folder="pdf_documents", db_directory="db", processed_files_path="processed_files.json",
+                 ingest_workers=1, embedding_cache_dir="embedding_cache", inference_backend="torch",
+                 search_mode="hybrid", vector_store="chroma"):
+        super().__init__(pdf_folder, db_directory, processed_files_path, ingest_workers, embedding_cache_dir,
+                         inference_backend, search_mode, vector_store)
         
         # Cấu hình adaptive
-        self.rerank_cache = {}
         self.cache_size = 100
+        # Câu hỏi diễn đạt khác nhưng cùng nghĩa (cosine >= 0.95) dùng lại kết quả đã tìm;
+        # cache tự bỏ các mục cũ sau mỗi lần thêm/xóa tài liệu (corpus_version)
+        self.rerank_cache = SemanticQueryCache(max_entries=self.cache_size, ttl=3600, threshold=0.95)
         self.query_complexity_threshold = 8  # Số từ trong câu hỏi để kích hoạt reranking
         self.confidence_threshold = 0.75
+        
+        # Số kết quả thay đổi theo phân bố điểm rerank (sigmoid, 0-1; điểm vector không cùng thang nên
+        # không dùng để cắt): cắt danh sách tại khoảng cách điểm lớn, dưới tỉ lệ so với kết quả đầu,
+        # hoặc dưới độ tin cậy tối thiểu; số ứng viên được rerank co giãn theo đó
+        self.adaptive_k = True
+        self.score_gap = 0.15
+        self.relative_score = 0.6
+        self.min_confidence = 0.2
+        self.dominant_score = 0.85  # Kết quả đầu vượt ngưỡng này và cách xa kết quả thứ hai: dừng sớm
+        self.candidate_depth = 10  # Số ứng viên lấy ban đầu
+        self.max_candidate_depth = 20  # Lấy thêm khi điểm đều nhau đến cuối danh sách
+        self.rerank_step = 5  # Số ứng viên rerank mỗi đợt; chỉ rerank đợt tiếp khi điểm vẫn đều nhau
+        self.last_search_decision = None
         self.use_lightweight_model = True  # Sử dụng mô hình nhẹ cho thiết bị yếu
         
         # Khởi tạo reranker khi cần
-        self._reranker = None
+        self._rerank_service = None
+        self.rerank_max_batch_size = 32  # Số cặp tối đa mỗi lần predict
+        self.rerank_max_wait = 0.01  # Thời gian chờ gom truy vấn đồng thời (giây)
         
         # Tối ưu hóa cơ sở dữ liệu vector
         self._optimize_db()
     
     def _optimize_db(self):
         """Tối ưu hóa cài đặt cho cơ sở dữ liệu vector"""
+        if self.vector_store != "chroma":
+            return
+        from chromadb.config import Settings
+        
         chroma_settings = Settings(
             anonymized_telemetry=False,
             persist_directory=self.db_directory,
         )
         
-        if os.path.exists(self.db_directory):
-            self.db = Chroma(
-                persist_directory=self.db_directory,
-                embedding_function=self.embeddings,
-                client_settings=chroma_settings
-            )
-        else:
-            self.db = Chroma(
-                persist_directory=self.db_directory,
-                embedding_function=self.embeddings,
-                client_settings=chroma_settings
-            )
+        self.db = get_vector_store(self.db_directory, self.embeddings, client_settings=chroma_settings,
+                                   backend=self.vector_store)
     
-    def _get_reranker(self):
-        """Lazy loading reranker model với quantization nếu có thể"""
-        if self._reranker is None:
-            try:
-                from sentence_transformers import CrossEncoder
-                import torch
-                
-                # Chọn mô hình reranker phù hợp với tài nguyên
-                model_name = 'BAAI/bge-reranker-base' if self.use_lightweight_model else 'BAAI/bge-reranker-v2-m3'
-                self._reranker = CrossEncoder(model_name)
-                
-                # Quantize model nếu có thể
-                try:
-                    if hasattr(torch, 'quantization') and hasattr(self._reranker.model, 'to'):
-                        self._reranker.model = torch.quantization.quantize_dynamic(
-                            self._reranker.model, {torch.nn.Linear}, dtype=torch.qint8
-                        )
-                        print("Successfully quantized reranker model")
-                except Exception as e:
-                    print(f"Quantization not supported: {str(e)}")
-                    
-            except Exception as e:
-                print(f"Error loading reranker: {str(e)}")
-                self._reranker = None
+    def _get_rerank_service(self):
+        """Service gom cặp (query, passage) từ mọi truy vấn đang chạy, dùng chung cho mọi phiên"""
+        if self._rerank_service is None:
+            model_name = 'BAAI/bge-reranker-base' if self.use_lightweight_model else 'BAAI/bge-reranker-v2-m3'
+            self._rerank_service = get_rerank_service(
+                model_name, quantize=True,
+                max_batch_size=self.rerank_max_batch_size,
+                max_wait=self.rerank_max_wait,
+                backend=self.inference_backend
+            )
         
-        return self._reranker
-    
-    def _get_cache_key(self, query):
-        """Tạo khóa cache từ query"""
-        return hashlib.md5(query.encode()).hexdigest()
+        return self._rerank_service
     
     def _analyze_query_complexity(self, query):
         """Phân tích độ phức tạp của câu hỏi"""
@@ -304,122 +96,191 @@ class AdaptivePDFProcessor(PDFProcessor):
         
         return complexity
     
-    def _rerank_batch(self, query, batch):
-        """Rerank một batch nhỏ các documents"""
-        reranker = self._get_reranker()
-        if not reranker:
-            # Trả về batch với điểm số mặc định nếu không có reranker
-            return [(doc, 0.5) for doc in batch]
-            
-        # Chuẩn bị cặp (query, passage)
-        pairs = [(query, doc.page_content) for doc in batch]
+    def search_similar(self, query, k=5):
+        """Adaptive search strategy với caching và reranking theo micro-batch"""
+        start_time = time.time()
         
-        # Tính điểm tương đồng
-        scores = reranker.predict(pairs)
+        # Câu hỏi dạng từ khóa (mã số, số điều, tên riêng): trả lời thẳng từ chỉ mục BM25, không cần
+        # rerank; cũng không dùng cache ngữ nghĩa vì "Điều 12" và "Điều 13" có vector rất giống nhau
+        keyword_results = self._keyword_search(query, k)
+        if keyword_results:
+            return keyword_results
         
-        # Trả về cặp (document, score)
-        return list(zip(batch, scores))
-    
-    def search_similar(self, query, k=5):
-        """Adaptive search strategy với caching và xử lý song song"""
-        # Kiểm tra cache
-        cache_key = self._get_cache_key(query)
-        if cache_key in self.rerank_cache:
-            print("Using cached results")
-            return self.rerank_cache[cache_key][:k]
+        # Phiên bản dữ liệu lấy trước khi tìm: nếu có ingest xong giữa chừng, kết quả (của dữ liệu cũ)
+        # được lưu với phiên bản cũ và bị bỏ ở lần tra cache sau, không bị coi là mới
+        corpus_version = self.corpus_version
+        
+        # Kiểm tra cache theo ngữ nghĩa (vector câu hỏi cũng được dùng lại cho bước tìm kiếm bên dưới)
+        # Chỉ dùng lại kết quả của câu hỏi có cùng mã số/số hiệu ("Điều 12 quy định gì?" khác "Điều 13 quy định gì?")
+        query_vector = self.embeddings.embed_query(query)
+        query_codes = code_tokens(query)
+        cached_results, similarity = self.rerank_cache.get(query_vector, corpus_version, query_codes)
+        if cached_results is not None:
+            stats = self.rerank_cache.stats()
+            print(
+                f"Using cached results (similarity {similarity:.3f}, hit rate {stats['hit_rate']:.0%}, "
+                f"saved {stats['saved_latency']:.2f}s so far)"
+            )
+            return cached_results[:k]
         
         # Phân tích độ phức tạp của câu hỏi
         query_complexity = self._analyze_query_complexity(query)
         print(f"Query complexity: {query_complexity}")
         
-        # Tìm kiếm ban đầu với vector embeddings
-        try:
-            initial_results = self.db.similarity_search_with_relevance_scores(query, k=10)
-        except:
-            # Fallback nếu không hỗ trợ relevance scores
-            initial_results = [(doc, 0.5) for doc in self.db.similarity_search(query, k=10)]
+        # Tìm kiếm ban đầu với vector embeddings (kết hợp BM25 ở chế độ hybrid)
+        initial_results = self._initial_candidates(query, self.candidate_depth)
+        decision = {'complexity': query_complexity, 'candidates': len(initial_results)}
         
         # Kiểm tra độ tin cậy của kết quả
         high_confidence_docs = []
-        low_confidence_docs = []
+        high_confidence_scores = []
         
         for doc, score in initial_results:
+            # Đoạn chỉ BM25 tìm thấy mang điểm BM25 chuẩn hóa, không cùng thang với điểm vector
+            if self._is_sparse_only(doc):
+                continue
             # Điều chỉnh công thức tính confidence dựa trên loại điểm số
             # Giả sử điểm số cao hơn = tốt hơn
             confidence = score
             
             if confidence >= self.confidence_threshold:
                 high_confidence_docs.append(doc)
-            else:
-                low_confidence_docs.append(doc)
+                high_confidence_scores.append(score)
         
-        # Quyết định chiến lược
-        need_reranking = query_complexity > self.query_complexity_threshold or len(high_confidence_docs) < k
+        # Quyết định chiến lược; đoạn chỉ BM25 tìm thấy nằm trong top k luôn được reranker chấm lại
+        need_reranking = (
+            query_complexity > self.query_complexity_threshold or len(high_confidence_docs) < k
+            or any(self._is_sparse_only(doc) for doc, _ in initial_results[:k])
+        )
         
         if not need_reranking and len(high_confidence_docs) >= k:
             # Trường hợp đơn giản: Kết quả embedding đã đủ tốt
             print("Using high confidence embedding results (no reranking needed)")
-            results = high_confidence_docs[:k]
+            results = self._select_results(high_confidence_docs, k, scores=high_confidence_scores)
+            strategy, num_reranked = 'embedding', 0
         else:
             # Trường hợp phức tạp: Cần reranking
             print("Reranking required for better results")
             
-            # Lấy tất cả documents để rerank
-            docs_to_rerank = [doc for doc, _ in initial_results]
-            
             # Kiểm tra xem có thể sử dụng reranker không
-            reranker = self._get_reranker()
-            if reranker:
-                # Chia nhỏ batch để xử lý song song nếu có nhiều kết quả
-                if len(docs_to_rerank) > 5:
-                    print("Using parallel processing for reranking")
-                    batch_size = 5
-                    batches = [docs_to_rerank[i:i+batch_size] for i in range(0, len(docs_to_rerank), batch_size)]
-                    
-                    final_scored_results = []
-                    
-                    # Xử lý song song các batch
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-                        future_to_batch = {
-                            executor.submit(self._rerank_batch, query, batch): batch 
-                            for batch in batches
-                        }
-                        
-                        for future in concurrent.futures.as_completed(future_to_batch):
-                            batch_results = future.result()
-                            final_scored_results.extend(batch_results)
-                    
-                    # Sắp xếp lại tất cả kết quả theo điểm số
-                    final_scored_results.sort(key=lambda x: x[1], reverse=True)
-                    
-                    # Trả về top k documents
-                    results = [doc for doc, _ in final_scored_results[:k]]
-                else:
-                    # Xử lý tuần tự nếu ít kết quả
-                    print("Using sequential reranking")
-                    pairs = [(query, doc.page_content) for doc in docs_to_rerank]
-                    scores = reranker.predict(pairs)
-                    
-                    scored_results = list(zip(docs_to_rerank, scores))
-                    scored_results.sort(key=lambda x: x[1], reverse=True)
-                    
-                    results = [doc for doc, _ in scored_results[:k]]
+            rerank_service = self._get_rerank_service()
+            if rerank_service:
+                scored_results, strategy = self._adaptive_rerank(query, initial_results, k, rerank_service, decision)
+                num_reranked = len(scored_results)
+                
+                # Cắt theo điểm rerank; đoạn dưới độ tin cậy tối thiểu không được dùng để lấp chỗ trống
+                cutoff, decision['reason'] = self._cutoff([score for _, score in scored_results], k)
+                kept = [(doc, score) for doc, score in scored_results if score >= self.min_confidence] \
+                    if self.adaptive_k else scored_results
+                kept = kept or scored_results[:cutoff]
+                
+                # Gộp các đoạn chồng lấn của cùng một trang, chỗ trống được lấp bằng kết quả đa dạng (MMR)
+                results = self._select_results(
+                    [doc for doc, _ in kept], cutoff, scores=[score for _, score in kept]
+                )
             else:
-                # Fallback nếu không có reranker
+                # Fallback nếu không có reranker: điểm vector không đủ tin cậy để cắt, giữ k kết quả
                 print("Reranker not available, using embedding results")
-                results = docs_to_rerank[:k]
+                results = self._select_results([doc for doc, _ in initial_results], k)
+                strategy, num_reranked = 'embedding', 0
         
-        # Lưu vào cache
-        self.rerank_cache[cache_key] = results
+        self._log_search_decision(query, decision, strategy, num_reranked, len(results), start_time)
         
-        # Giới hạn kích thước cache
-        if len(self.rerank_cache) > self.cache_size:
-            oldest_key = next(iter(self.rerank_cache))
-            del self.rerank_cache[oldest_key]
+        # Lưu vào cache cùng thời gian đã tốn để tính saved latency khi trúng cache
+        self.rerank_cache.put(query_vector, corpus_version, results, time.time() - start_time, query_codes)
         
         return results
     
-    def process_pdfs(self):
+    def _initial_candidates(self, query, depth):
+        """(document, relevance score) của `depth` ứng viên đầu tiên"""
+        try:
+            return self._retrieve_with_relevance_scores(query, k=depth)
+        except Exception:
+            # Fallback nếu không hỗ trợ relevance scores
+            return [(doc, 0.5) for doc in self._similarity_search(query, k=depth)]
+    
+    def _adaptive_rerank(self, query, initial_results, k, rerank_service, decision):
+        """
+        Rerank ứng viên theo từng đợt `rerank_step` theo thứ tự tìm kiếm ban đầu. Sau mỗi đợt, danh sách
+        điểm rerank được cắt như _cutoff: nếu điểm cắt nằm trong phần đã rerank (hoặc một đoạn vượt trội
+        hẳn) thì dừng, nếu điểm vẫn đều nhau thì rerank đợt tiếp, và lấy thêm tới `max_candidate_depth`
+        ứng viên khi đã rerank hết. Trả về ((document, score) đã sắp xếp, chiến lược).
+        """
+        candidates = [doc for doc, _ in initial_results]
+        depth = min(self.rerank_step, len(candidates)) if self.adaptive_k else len(candidates)
+        scored_results = []
+        strategy = 'rerank'
+        while True:
+            # Các truy vấn đồng thời được gom chung vào một lần predict trong service
+            batch = candidates[len(scored_results):depth]
+            scores = rerank_service.score(query, [doc.page_content for doc in batch])
+            scored_results = sorted(scored_results + list(zip(batch, scores)), key=lambda x: x[1], reverse=True)
+            if not self.adaptive_k:
+                break
+            
+            top_scores = [score for _, score in scored_results]
+            decision['top_score'] = top_scores[0] if top_scores else 0.0
+            decision['top_gap'] = top_scores[0] - top_scores[1] if len(top_scores) > 1 else 0.0
+            if (top_scores and decision['complexity'] <= self.query_complexity_threshold
+                    and top_scores[0] >= self.dominant_score and decision['top_gap'] >= self.score_gap):
+                # Một đoạn vượt trội hẳn: dừng sớm, không rerank thêm và gửi ngữ cảnh nhỏ
+                strategy = 'early_exit' if depth < len(candidates) else strategy
+                break
+            cutoff, reason = self._cutoff(top_scores, len(top_scores))
+            if reason != "max_k":
+                # Danh sách đã bị cắt trong phần đã rerank: các ứng viên sau khó vào được top
+                break
+            if depth < len(candidates):
+                depth = min(depth + self.rerank_step, len(candidates))
+            elif self.candidate_depth <= len(candidates) < self.max_candidate_depth:
+                # Điểm vẫn đều nhau đến ứng viên cuối: lấy thêm ứng viên để rerank
+                known = {doc.metadata.get("chunk_id") for doc in candidates}
+                more = [
+                    doc for doc, _ in self._initial_candidates(query, self.max_candidate_depth)
+                    if doc.metadata.get("chunk_id") not in known
+                ]
+                if not more:
+                    break
+                candidates += more
+                depth = min(depth + self.rerank_step, len(candidates))
+                decision['candidates'] = len(candidates)
+            else:
+                break
+        return scored_results, strategy
+    
+    def _cutoff(self, scores, k):
+        """
+        Số kết quả nên giữ (tối đa k) và lý do, theo phân bố điểm rerank (thang 0-1);
+        luôn là k nếu tắt adaptive_k
+        """
+        if not self.adaptive_k:
+            return min(k, len(scores)), "max_k"
+        return adaptive_cutoff(
+            scores, k, gap=self.score_gap, relative=self.relative_score, min_score=self.min_confidence
+        )
+    
+    def _log_search_decision(self, query, decision, strategy, num_reranked, num_results, start_time):
+        """Ghi lại quyết định của từng truy vấn (in ra console và lưu ở last_search_decision)"""
+        decision.update({
+            'strategy': strategy,
+            'reranked': num_reranked,
+            'returned': num_results,
+            'latency': time.time() - start_time,
+        })
+        self.last_search_decision = decision
+        scores = f", top {decision['top_score']:.3f} (gap {decision['top_gap']:.3f})" if 'top_score' in decision else ""
+        reason = f" ({decision['reason']})" if 'reason' in decision else ""
+        print(
+            f"Adaptive search for '{query[:50]}': {strategy}{scores}, "
+            f"reranked {num_reranked}/{decision['candidates']} candidates, returned {num_results}{reason} "
+            f"in {decision['latency'] * 1000:.0f} ms"
+        )
+    
+    def semantic_cache_stats(self):
+        """Tỉ lệ trúng cache và tổng thời gian tiết kiệm được"""
+        return self.rerank_cache.stats()
+    
+    def process_pdfs(self, workers=None, verify=False, progress=None, files=None):
         """Ghi đè phương thức process_pdfs để thêm thông báo"""
         print("Using Adaptive PDF Processor for document processing")
-        super().process_pdfs()
+        super().process_pdfs(workers, verify, progress, files)
@@ -0,0 +1,472 @@
+import os
+import time
+import threading
+from datetime import datetime
+from pdf_ingest import IngestPipeline, changed_pages
+from model_registry import get_embeddings, get_vector_store, get_sparse_index
+from bm25_index import is_keyword_query, reciprocal_rank_fusion
+from result_selection import select_results
+from file_manifest import (HASH_ALGORITHM, find_changed_files, manifest_path, load_manifest,
+                           append_manifest_entry, compact_manifest)
+from index_maintenance import directory_size, format_bytes
+
+class BasePDFProcessor:
+    """
+    Ingest and search code shared by the PDFProcessor classes of pdf_processor.py,
+    pdf_processor_rerank.py and pdf_processor_adaptive.py. Subclasses choose the
+    embedding model and override search_similar to add reranking.
+    """
+    # Sentence-transformers model that embeds chunks and queries
+    embedding_model = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+    def __init__(self, pdf_folder="pdf_documents", db_directory="db", processed_files_path="processed_files.json",
+                 ingest_workers=1, embedding_cache_dir="embedding_cache", inference_backend="torch",
+                 search_mode="hybrid", vector_store="chroma"):
+        self.pdf_folder = pdf_folder
+        self.db_directory = db_directory
+        # One list per vector store (processed_files.faiss-hnsw.json, ...): switching stores must not
+        # skip files that only the other store has chunks for
+        self.processed_files_path = manifest_path(processed_files_path, vector_store)
+        # Number of worker processes used to extract/split PDFs in process_pdfs
+        self.ingest_workers = ingest_workers
+        # "torch" or "onnx" (int8 ONNX Runtime export, faster on CPU-only boards)
+        self.inference_backend = inference_backend
+        # "hybrid" fuses BM25 and vector rankings, "vector" uses embeddings only
+        self.search_mode = search_mode
+        # Merge overlapping chunks of the same page in search results and fill the freed
+        # slots with diverse candidates; mmr_lambda trades relevance (1.0) for diversity
+        self.merge_overlaps = True
+        self.mmr_lambda = 0.7
+        # "chroma", or a FAISS index kept next to it ("faiss-flat", "faiss-hnsw", "faiss-ivfpq")
+        self.vector_store = vector_store
+        
+        # Chunk vectors are cached on disk by (model, text), so rebuilding db skips inference;
+        # the model itself is shared by every processor in the process
+        self.embeddings = get_embeddings(
+            self.embedding_model,
+            cache_dir=embedding_cache_dir,
+            backend=inference_backend
+        )
+        
+        # Improved text splitting for better context preservation
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1500,
+            chunk_overlap=300,
+            separators=["\n\n", "\n", " ", ""],
+            length_function=len
+        )
+        
+        self.db = None
+        # Bumped whenever chunks are added, changed or removed, so search caches can tell they are stale
+        self.corpus_version = 0
+        # Serialises process_pdfs/remove_files between the background job and the folder watcher
+        self._ingest_lock = threading.RLock()
+        
+        # Create directories if they don't exist
+        os.makedirs(pdf_folder, exist_ok=True)
+        os.makedirs(db_directory, exist_ok=True)
+        
+        # Load processed files list
+        self.processed_files = self._load_processed_files()
+        
+        # Initialize or load vector store
+        self._initialize_db()
+        self._initialize_sparse_index()
+
+    def _load_processed_files(self):
+        """Load list of processed files, including the entries journaled since it was last saved"""
+        try:
+            processed_files = load_manifest(self.processed_files_path)
+        except ValueError as e:
+            # Chunk IDs are deterministic, so rebuilding the list can't duplicate chunks
+            print(f"Error reading {self.processed_files_path}, rebuilding it: {str(e)}")
+            return {}
+        if os.path.exists(self.processed_files_path + ".journal"):
+            # Left by a run that stopped mid-batch: fold it in before appending to it again
+            compact_manifest(self.processed_files_path, processed_files)
+        return processed_files
+
+    def _save_processed_files(self):
+        """Save list of processed files (atomically, so a crash never leaves it half-written)"""
+        compact_manifest(self.processed_files_path, self.processed_files)
+
+    def _record_processed_file(self, file):
+        """Checkpoint one file's entry (or its removal) without rewriting the whole list"""
+        append_manifest_entry(self.processed_files_path, file, self.processed_files.get(file))
+
+    def _initialize_db(self):
+        """Initialize or load vector store (shared with other processors on the same directory)"""
+        self.db = get_vector_store(self.db_directory, self.embeddings, backend=self.vector_store)
+        lost = [file for file in getattr(self.db, "lost_files", ()) if file in self.processed_files]
+        if lost:
+            # Their vectors weren't saved before a crash: process them again
+            print(f"{len(lost)} files lost chunks in the {self.vector_store} vector store and will be processed again")
+            for file in lost:
+                del self.processed_files[file]
+            self._save_processed_files()
+        if self.processed_files and self.db.count() == 0:
+            # e.g. switched to a vector store that hasn't been filled yet: ingest everything again
+            print(f"The {self.vector_store} vector store is empty, all PDFs will be processed again")
+            self.processed_files = {}
+            self._save_processed_files()
+    
+    def _initialize_sparse_index(self, batch_size=5000):
+        """Open the BM25 index next to the vector store, filling it from the store the first time"""
+        self.sparse_index = get_sparse_index(os.path.join(self.db_directory, "bm25_index.sqlite3"))
+        with self._ingest_lock:
+            if self.sparse_index.complete:
+                return
+            start_time = time.time()
+            offset = 0
+            while True:
+                batch = self.db.get(include=["documents"], limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    break
+                missing = [
+                    (chunk_id, text) for chunk_id, text in zip(batch["ids"], batch["documents"])
+                    if chunk_id not in self.sparse_index
+                ]
+                if missing:
+                    self.sparse_index.add_documents([chunk_id for chunk_id, _ in missing], [text for _, text in missing])
+                offset += len(batch["ids"])
+            self.sparse_index.mark_complete()
+            if offset:
+                print(f"Built BM25 index for {offset} chunks in {time.time() - start_time:.2f}s")
+    
+    def _plan_file_chunks(self, file, splits):
+        """
+        Work out the vector store changes that make it hold exactly `splits` for `file`.
+        Chunks are keyed on their content-derived chunk_id. The previous version's
+        chunk IDs come from processed_files.json (or from the store for files
+        recorded before per-chunk tracking): new IDs have to be embedded and added,
+        IDs that are no longer produced are stale, and unchanged chunks are not
+        re-embedded - only their metadata is refreshed if their page moved.
+        Returns {'add': [Document], 'moved': [Document], 'stale': [chunk_id]}.
+        """
+        new_chunks = {doc.metadata["chunk_id"]: doc for doc in splits}
+        previous = self.processed_files.get(file, {}).get('chunks')
+        # total_pages is stored on every chunk, so a page count change touches them all
+        new_total_pages = splits[0].metadata.get("total_pages") if splits else None
+        refresh_all = self.processed_files.get(file, {}).get('num_pages') != new_total_pages
+
+        if previous is None:
+            existing = self.db.get(where={"file_name": file}, include=["metadatas"])
+            previous = {
+                chunk_id: metadata.get("page")
+                for chunk_id, metadata in zip(existing["ids"], existing["metadatas"])
+            }
+        else:
+            # Trust the manifest only for chunks the store really still has
+            kept = [chunk_id for chunk_id in new_chunks if chunk_id in previous]
+            stored = set(self.db.get(ids=kept, include=[])["ids"]) if kept else set()
+            previous = {
+                chunk_id: page for chunk_id, page in previous.items()
+                if chunk_id in stored or chunk_id not in new_chunks
+            }
+
+        return {
+            'add': [doc for chunk_id, doc in new_chunks.items() if chunk_id not in previous],
+            'moved': [
+                doc for chunk_id, doc in new_chunks.items()
+                if chunk_id in previous
+                and (refresh_all or previous[chunk_id] != doc.metadata.get("page"))
+            ],
+            'stale': [chunk_id for chunk_id in previous if chunk_id not in new_chunks],
+        }
+
+    def _write_file_chunks(self, plan, vectors):
+        """Apply a plan from _plan_file_chunks, with `vectors` already computed for plan['add']"""
+        if plan['add']:
+            self.db.upsert(
+                ids=[doc.metadata["chunk_id"] for doc in plan['add']],
+                embeddings=vectors,
+                metadatas=[doc.metadata for doc in plan['add']],
+                documents=[doc.page_content for doc in plan['add']]
+            )
+            self.sparse_index.add_documents(
+                [doc.metadata["chunk_id"] for doc in plan['add']],
+                [doc.page_content for doc in plan['add']]
+            )
+        if plan['moved']:
+            self.db.update_metadata(
+                ids=[doc.metadata["chunk_id"] for doc in plan['moved']],
+                metadatas=[doc.metadata for doc in plan['moved']]
+            )
+        if plan['stale']:
+            self.db.delete(ids=plan['stale'])
+            self.sparse_index.delete(plan['stale'])
+        if plan['add'] or plan['moved'] or plan['stale']:
+            self.corpus_version += 1
+
+    def remove_files(self, files):
+        """
+        Delete the chunks and processed_files.json entries of PDFs that are no
+        longer in the folder. Returns the number of chunks removed.
+        """
+        num_removed = 0
+        with self._ingest_lock:
+            removed = False
+            for file in files:
+                entry = self.processed_files.get(file) or {}
+                chunk_ids = list(entry.get('chunks') or [])
+                if not chunk_ids:
+                    chunk_ids = self.db.get(where={"file_name": file}, include=[])["ids"]
+                if chunk_ids:
+                    self.db.delete(ids=chunk_ids)
+                    self.sparse_index.delete(chunk_ids)
+                    self.corpus_version += 1
+                num_removed += len(chunk_ids)
+                
+                if self.processed_files.pop(file, None) is not None:
+                    self._record_processed_file(file)
+                    removed = True
+                print(f"Removed {file}: {len(chunk_ids)} chunks")
+            self.db.persist()
+            if removed:
+                self._save_processed_files()
+        return num_removed
+
+    def collect_garbage(self, batch_size=5000):
+        """
+        Purge files deleted from the folder, remove vectors that no file in
+        processed_files.json accounts for and give the space back to the
+        filesystem. A chunk is orphaned when its file is not in the list any
+        more, or when the file's entry records its chunk IDs and this one is not
+        among them (e.g. left behind by an interrupted update).
+        Returns {'vectors_removed', 'bytes_before', 'bytes_after', 'bytes_reclaimed'}.
+        """
+        with self._ingest_lock:
+            bytes_before = directory_size(self.db_directory)
+            missing = [
+                file for file in self.processed_files
+                if not os.path.exists(os.path.join(self.pdf_folder, file))
+            ]
+            num_purged = self.remove_files(missing) if missing else 0
+
+            orphans = []
+            offset = 0
+            while True:
+                batch = self.db.get(include=["metadatas"], limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    break
+                for chunk_id, metadata in zip(batch["ids"], batch["metadatas"]):
+                    entry = self.processed_files.get((metadata or {}).get("file_name"))
+                    if entry is None or ('chunks' in entry and chunk_id not in entry['chunks']):
+                        orphans.append(chunk_id)
+                offset += len(batch["ids"])
+
+            for i in range(0, len(orphans), batch_size):
+                self.db.delete(ids=orphans[i:i + batch_size])
+                self.sparse_index.delete(orphans[i:i + batch_size])
+
+            self.db.compact()
+            bytes_after = directory_size(self.db_directory)
+
+        stats = {
+            'vectors_removed': len(orphans) + num_purged,
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after,
+            'bytes_reclaimed': max(bytes_before - bytes_after, 0),
+        }
+        print(
+            f"Garbage collection removed {stats['vectors_removed']} vectors ({len(orphans)} orphaned) "
+            f"and reclaimed {format_bytes(stats['bytes_reclaimed'])} ({format_bytes(bytes_before)} -> {format_bytes(bytes_after)})"
+        )
+        return stats
+
+    def process_pdfs(self, workers=None, verify=False, progress=None, files=None):
+        """
+        Process new or changed PDF files with adaptive loader selection, and purge
+        the chunks of files that were deleted from the folder.
+        Files whose size/mtime/inode match processed_files.json are skipped without
+        being read; verify=True hashes every file instead.
+        Files go through IngestPipeline: extraction (in `workers` processes),
+        cleaning, splitting and embedding overlap across files, while writes to the
+        vector store and processed_files.json stay in this thread. Each file is
+        searchable as soon as it is committed; pass an IngestProgress as `progress`
+        to follow along from another thread. `files` limits the check to those file
+        names (used by the folder watcher).
+        """
+        with self._ingest_lock:
+            self._process_pdfs(workers, verify, progress, files)
+
+    def _process_pdfs(self, workers, verify, progress, files):
+        workers = workers or self.ingest_workers
+        scan_start = time.time()
+        changed, num_refreshed = find_changed_files(
+            self.pdf_folder, self.processed_files, verify=verify, files=files
+        )
+        print(f"Scanned {self.pdf_folder} in {time.time() - scan_start:.2f}s: {len(changed)} new or changed files")
+        if num_refreshed:
+            self._save_processed_files()
+        
+        # Files deleted from the folder since the last run: purge their chunks
+        if files is None:
+            present = set(os.listdir(self.pdf_folder))
+            removed = [file for file in self.processed_files if file not in present]
+            if removed:
+                print(f"{len(removed)} PDF files were removed from {self.pdf_folder}")
+                self.remove_files(removed)
+        
+        pending = []
+        file_info = {}
+        for file, pdf_path, current_hash, stat in changed:
+            print(f"Processing new file: {file}")
+            pending.append((file, pdf_path))
+            file_info[file] = (current_hash, stat)
+        
+        def commit(result, vectors):
+            file = result['file']
+            if file in self.processed_files:
+                pages = changed_pages(self.processed_files[file].get('page_hashes'), result['page_hashes'])
+                print(f"{file} changed: {len(pages)}/{len(result['page_hashes'])} pages differ")
+            
+            # Upsert into vector store, replacing chunks from older versions of the file
+            self._write_file_chunks(result['plan'], vectors)
+            
+            # Update processed file info
+            current_hash, stat = file_info[file]
+            self.processed_files[file] = {
+                'hash': current_hash,
+                'hash_algo': HASH_ALGORITHM,
+                **stat,
+                'processed_date': datetime.now().isoformat(),
+                'num_pages': len(result['documents']),
+                'num_chunks': len(result['splits']),
+                'is_scanned': result['is_scanned'],
+                'ocr_pages': result['ocr_pages'],
+                'page_hashes': result['page_hashes'],
+                'chunks': {doc.metadata['chunk_id']: doc.metadata.get('page') for doc in result['splits']}
+            }
+            # Checkpoint after every file: its chunks are already in the store, so
+            # a crash later in the batch doesn't make us embed it again
+            self._record_processed_file(file)
+        
+        pipeline = IngestPipeline(
+            self.text_splitter,
+            plan=self._plan_file_chunks,
+            embed=self.embeddings.embed_documents,
+            commit=commit,
+            extract_workers=workers,
+            progress=progress
+        )
+        if pipeline.run(pending):
+            print("Completed processing new PDF files")
+        self.db.persist()
+        if pending:
+            # Fold the per-file journal into processed_files.json once per batch
+            self._save_processed_files()
+
+    def _similarity_search(self, query, k):
+        """Search the vector store by vector; repeated queries reuse the cached query vector instead of re-embedding"""
+        return self.db.similarity_search_by_vector(self.embeddings.embed_query(query), k=k)
+
+    def _similarity_search_with_relevance_scores(self, query, k):
+        """Like _similarity_search but returns (document, relevance score in [0, 1]) pairs"""
+        return self.db.similarity_search_by_vector_with_relevance_scores(self.embeddings.embed_query(query), k=k)
+
+    def _fetch_documents(self, chunk_ids):
+        """Documents for the given chunk IDs from the vector store, as {chunk_id: Document}"""
+        from langchain_core.documents import Document
+        if not chunk_ids:
+            return {}
+        found = self.db.get(ids=list(chunk_ids), include=["documents", "metadatas"])
+        return {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+
+    def _keyword_search(self, query, k):
+        """
+        In hybrid mode, answer keyword-like queries (codes, numbers, names) from the
+        BM25 index alone. Returns None when the query isn't one or nothing matched.
+        """
+        if self.search_mode != "hybrid" or not is_keyword_query(query):
+            return None
+        start_time = time.time()
+        hits = self.sparse_index.search(query, k)
+        if not hits:
+            return None
+        documents = self._fetch_documents([chunk_id for chunk_id, _ in hits])
+        print(f"Keyword query answered from the BM25 index in {(time.time() - start_time) * 1000:.1f} ms")
+        return [documents[chunk_id] for chunk_id, _ in hits if chunk_id in documents]
+
+    def _hybrid_search_with_relevance_scores(self, query, k, candidates=20):
+        """
+        Fuse the vector and BM25 rankings with reciprocal rank fusion. Returns
+        (document, relevance score) pairs in fused order. Chunks the vector search
+        found keep their vector relevance score; a chunk only BM25 found gets its
+        BM25 score over the query's best BM25 score instead, and is flagged with
+        metadata["retrieval_source"] = "bm25" since that score isn't on the same
+        scale (see _is_sparse_only).
+        """
+        dense = self._similarity_search_with_relevance_scores(query, k=max(k, candidates))
+        sparse = self.sparse_index.search(query, max(k, candidates))
+        dense_by_id = {
+            getattr(doc, "id", None) or doc.metadata.get("chunk_id"): (doc, score)
+            for doc, score in dense
+        }
+        fused = reciprocal_rank_fusion([list(dense_by_id), [chunk_id for chunk_id, _ in sparse]])[:k]
+        sparse_documents = self._fetch_documents([chunk_id for chunk_id in fused if chunk_id not in dense_by_id])
+
+        sparse_scores = dict(sparse)
+        best_sparse = max(sparse_scores.values(), default=0.0)
+        results = []
+        for chunk_id in fused:
+            if chunk_id in dense_by_id:
+                results.append(dense_by_id[chunk_id])
+            elif chunk_id in sparse_documents:
+                doc = sparse_documents[chunk_id]
+                doc.metadata["retrieval_source"] = "bm25"
+                results.append((doc, sparse_scores[chunk_id] / best_sparse if best_sparse > 0 else 0.0))
+        return results
+
+    @staticmethod
+    def _is_sparse_only(doc):
+        """True for a hybrid search hit that only BM25 found (its score is normalised BM25, not vector relevance)"""
+        return doc.metadata.get("retrieval_source") == "bm25"
+
+    def _retrieve_with_relevance_scores(self, query, k):
+        """(document, relevance score) pairs from the search_mode's retriever"""
+        if self.search_mode == "hybrid":
+            return self._hybrid_search_with_relevance_scores(query, k)
+        return self._similarity_search_with_relevance_scores(query, k)
+
+    def _retrieve(self, query, k):
+        """Documents from the search_mode's retriever"""
+        if self.search_mode == "hybrid":
+            return [doc for doc, _ in self._hybrid_search_with_relevance_scores(query, k)]
+        return self._similarity_search(query, k)
+
+    def query_cache_stats(self):
+        """Hit/miss counters of the query-vector LRU cache"""
+        return self.embeddings.query_cache_stats()
+
+    def _select_results(self, candidates, k, scores=None):
+        """
+        Pick `k` results from `candidates` (best first, optionally with scores):
+        overlapping chunks of one page become a single span and the freed slots go
+        to the most relevant candidates that don't repeat what is already picked.
+        Chunk vectors come from the embedding cache, so this normally runs no model.
+        """
+        if not self.merge_overlaps or len(candidates) <= 1:
+            return candidates[:k]
+        start_time = time.time()
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in candidates])
+        results, stats = select_results(candidates, vectors, k, scores=scores, lambda_mult=self.mmr_lambda)
+        if stats['merged']:
+            print(
+                f"Merged {stats['merged']} overlapping chunks out of {stats['candidates']} candidates, "
+                f"{stats['chars_saved']} duplicate characters left out of the context "
+                f"({(time.time() - start_time) * 1000:.1f} ms)"
+            )
+        return results
+
+    def search_similar(self, query, k=5):
+        """Search for similar text passages"""
+        keyword_results = self._keyword_search(query, k)
+        if keyword_results:
+            return keyword_results
+        # Twice as many candidates, so slots freed by merging overlaps can be refilled
+        return self._select_results(self._retrieve(query, 2 * k), k)
@@ -1,227 +1,45 @@
-import os
-import hashlib
-import json
-import fitz  # PyMuPDF
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.document_loaders import PyMuPDFLoader, UnstructuredPDFLoader
-from langchain.schema import Document
-from datetime import datetime
-import pdf2image
-import pytesseract
-from typing import List
+import time
+from pdf_processor_base import BasePDFProcessor
+from model_registry import get_reranker
 
-class CustomOCRPDFLoader:
-    """Custom loader for OCR processing of PDFs using Tesseract."""
-    
-    def __init__(self, file_path: str, language: str = "vie"):
-        self.file_path = file_path
-        self.language = language
-    
-    def load(self) -> List[Document]:
-        """Load PDF and convert to text using OCR."""
-        # Convert PDF to images
-        images = pdf2image.convert_from_path(self.file_path)
-        
-        documents = []
-        for i, image in enumerate(images):
-            # Use pytesseract to extract text with Vietnamese language support
-            text = pytesseract.image_to_string(image, lang=self.language)
-            
-            # Create a Document for each page
-            doc = Document(
-                page_content=text,
-                metadata={
-                    "source": self.file_path,
-                    "page": i + 1,
-                    "total_pages": len(images),
-                    "processing_method": "ocr"
-                }
-            )
-            documents.append(doc)
-        
-        return documents
-
-
-class PDFProcessor:
-    def __init__(self, pdf_folder="pdf_documents", db_directory="db", processed_files_path="processed_files.json"):
-        self.pdf_folder = pdf_folder
-        self.db_directory = db_directory
-        self.processed_files_path = processed_files_path
-        
-        # Sử dụng thanhtantran/Vietnamese_Embedding_v2 làm model embedding
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="thanhtantran/Vietnamese_Embedding_v2"
-        )
-        
-        # Improved text splitting for better context preservation
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1500,
-            chunk_overlap=300,
-            separators=["\n\n", "\n", " ", ""],
-            length_function=len
-        )
-        
-        self.db = None
-        
-        # Create directories if they don't exist
-        os.makedirs(pdf_folder, exist_ok=True)
-        os.makedirs(db_directory, exist_ok=True)
-        
-        # Load processed files list
-        self.processed_files = self._load_processed_files()
-        
-        # Initialize or load vector store
-        self._initialize_db()
-
-    def _get_file_hash(self, filepath):
-        """Calculate file hash to check for changes"""
-        hasher = hashlib.md5()
-        with open(filepath, 'rb') as f:
-            buf = f.read(65536)
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = f.read(65536)
-        return hasher.hexdigest()
-
-    def _load_processed_files(self):
-        """Load list of processed files"""
-        if os.path.exists(self.processed_files_path):
-            with open(self.processed_files_path, 'r') as f:
-                return json.load(f)
-        return {}
-
-    def _save_processed_files(self):
-        """Save list of processed files"""
-        with open(self.processed_files_path, 'w') as f:
-            json.dump(self.processed_files, f, indent=2)
+class PDFProcessor(BasePDFProcessor):
+    # Sử dụng thanhtantran/Vietnamese_Embedding_v2 làm model embedding
+    embedding_model = "thanhtantran/Vietnamese_Embedding_v2"
 
-    def _initialize_db(self):
-        """Initialize or load vector store"""
-        if os.path.exists(self.db_directory):
-            self.db = Chroma(
-                persist_directory=self.db_directory,
-                embedding_function=self.embeddings
-            )
-        else:
-            self.db = Chroma(
-                persist_directory=self.db_directory,
-                embedding_function=self.embeddings
-            )
-    
-    def _is_scanned_pdf(self, pdf_path):
-        """
-        Check if a PDF is likely a scanned document by examining text content.
-        Returns True if likely scanned, False otherwise.
-        """
-        try:
-            # Open the PDF with PyMuPDF
-            doc = fitz.open(pdf_path)
-            total_pages = len(doc)
-            text_content = 0
-            
-            # Check first few pages (up to 5 or total pages, whichever is less)
-            pages_to_check = min(5, total_pages)
-            
-            for page_num in range(pages_to_check):
-                page = doc[page_num]
-                text = page.get_text()
-                text_content += len(text)
-            
-            doc.close()
-            
-            # Calculate average text per page
-            avg_text_per_page = text_content / pages_to_check
-            
-            # If very little text is found, it's likely a scanned document
-            # Threshold can be adjusted based on your documents
-            return avg_text_per_page < 100
-            
-        except Exception as e:
-            print(f"Error checking if PDF is scanned: {str(e)}")
-            # Default to non-scanned if we can't determine
-            return False
-
-    def process_pdfs(self):
-        """Process new or changed PDF files with adaptive loader selection"""
-        new_files_processed = False
+    def __init__(self, pdf_folder="pdf_documents", db_directory="db", processed_files_path="processed_files.json",
+                 ingest_workers=1, embedding_cache_dir="embedding_cache", inference_backend="torch",
+                 search_mode="hybrid", vector_store="chroma", quantize_reranker=False):
+        super().__init__(pdf_folder, db_directory, processed_files_path, ingest_workers, embedding_cache_dir,
+                         inference_backend, search_mode, vector_store)
         
-        # Check each file in directory
-        for file in os.listdir(self.pdf_folder):
-            if file.endswith('.pdf'):
-                pdf_path = os.path.join(self.pdf_folder, file)
-                try:
-                    current_hash = self._get_file_hash(pdf_path)
-                
-                    # Check if file has been processed or changed
-                    if (file not in self.processed_files or 
-                        self.processed_files[file]['hash'] != current_hash):
-                        
-                        print(f"Processing new file: {file}")
-                        
-                        # Determine if the PDF is scanned
-                        is_scanned = self._is_scanned_pdf(pdf_path)
-                        
-                        if is_scanned:
-                            print(f"Detected scanned document: {file}, using OCR processing")
-                            # Use our custom OCR loader for scanned documents
-                            loader = CustomOCRPDFLoader(
-                                pdf_path,
-                                language="vie"  # Vietnamese language code for Tesseract
-                            )
-                        else:
-                            print(f"Detected normal PDF: {file}, using PyMuPDF processing")
-                            # Use PyMuPDFLoader for regular PDFs
-                            loader = PyMuPDFLoader(pdf_path)
-                        
-                        documents = loader.load()
-                        
-                        # Add metadata to help with retrieval
-                        for doc in documents:
-                            doc.metadata["file_name"] = file
-                            doc.metadata["source"] = pdf_path
-                            doc.metadata["is_scanned"] = is_scanned
-                        
-                        # Split into chunks
-                        splits = self.text_splitter.split_documents(documents)
-                        
-                        # Add to vector store
-                        self.db.add_documents(splits)
-                        
-                        # Update processed file info
-                        self.processed_files[file] = {
-                            'hash': current_hash,
-                            'processed_date': datetime.now().isoformat(),
-                            'num_pages': len(documents),
-                            'num_chunks': len(splits),
-                            'is_scanned': is_scanned
-                        }
-                    
-                        new_files_processed = True
-                except Exception as e:
-                    print(f"Error processing file {file}: {str(e)}")
-        
-        # Save processed files info
-        if new_files_processed:
-            self._save_processed_files()
-            print("Completed processing new PDF files")
+        # Nạp sẵn reranker một lần lúc khởi động (dùng chung cho mọi truy vấn và mọi phiên)
+        self.reranker_model = 'thanhtantran/Vietnamese_Reranker'
+        self.quantize_reranker = quantize_reranker
+        self.reranker = get_reranker(self.reranker_model, quantize=quantize_reranker, backend=inference_backend)
+        self.last_rerank_latency = None
 
     def _rerank_results(self, query, initial_results, top_k=5):
         """
         Rerank results using thanhtantran/Vietnamese_Reranker
         """
         try:
-            from sentence_transformers import CrossEncoder
+            # Reranker được nạp một lần lúc khởi tạo; chỉ thử nạp lại nếu lần trước lỗi
+            if self.reranker is None:
+                self.reranker = get_reranker(self.reranker_model, quantize=self.quantize_reranker,
+                                             backend=self.inference_backend)
+                if self.reranker is None:
+                    return initial_results[:top_k]
             
-            # Khởi tạo cross-encoder cho reranking
-            reranker = CrossEncoder('thanhtantran/Vietnamese_Reranker')
+            start_time = time.time()
             
             # Chuẩn bị cặp (query, passage) cho reranker
             pairs = [(query, doc.page_content) for doc in initial_results]
             
             # Tính điểm tương đồng
-            scores = reranker.predict(pairs)
+            scores = self.reranker.predict(pairs)
+            
+            self.last_rerank_latency = time.time() - start_time
+            print(f"Reranked {len(pairs)} passages in {self.last_rerank_latency * 1000:.0f} ms")
             
             # Kết hợp điểm với documents
             scored_results = list(zip(initial_results, scores))
@@ -242,10 +60,15 @@ class PDFProcessor:
         """
         Search for similar text passages using embedding search followed by reranking
         """
-        # Bước 1: Tìm kiếm ban đầu với vector embeddings
-        initial_results = self.db.similarity_search(query, k=10)  # Lấy nhiều kết quả hơn để rerank
+        # Câu hỏi dạng từ khóa được trả lời thẳng từ chỉ mục BM25, không cần rerank
+        keyword_results = self._keyword_search(query, k)
+        if keyword_results:
+            return keyword_results
+        
+        # Bước 1: Tìm kiếm ban đầu với vector embeddings (kết hợp BM25 ở chế độ hybrid)
+        initial_results = self._retrieve(query, k=10)  # Lấy nhiều kết quả hơn để rerank
         
-        # Bước 2: Rerank kết quả
-        reranked_results = self._rerank_results(query, initial_results, top_k=k)
+        # Bước 2: Rerank toàn bộ ứng viên, rồi gộp các đoạn chồng lấn và chọn k kết quả đa dạng
+        reranked_results = self._rerank_results(query, initial_results, top_k=len(initial_results))
         
-        return reranked_results
+        return self._select_results(reranked_results, k)
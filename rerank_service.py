@@ -0,0 +1,96 @@
+import time
+import queue
+import threading
+import concurrent.futures
+
+
+class _Request:
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self.future = concurrent.futures.Future()
+
+
+class RerankService:
+    """
+    Micro-batching front end for a CrossEncoder shared by all in-flight queries.
+
+    Callers hand in their (query, passage) pairs and block until scored. A single
+    worker thread takes the first waiting request, keeps collecting requests for
+    up to `max_wait` seconds or until `max_batch_size` pairs are queued, and runs
+    one `predict` for all of them. Concurrent users therefore share one batched
+    forward pass instead of several torch calls fighting over the same cores.
+    """
+
+    def __init__(self, reranker, max_batch_size=32, max_wait=0.01):
+        self.reranker = reranker
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.pairs_scored = 0
+        self.batches = 0
+        self.requests = 0
+        self.busy_time = 0.0
+        self._thread = threading.Thread(target=self._run, name="rerank-service", daemon=True)
+        self._thread.start()
+
+    def score(self, query, passages):
+        """Scores for each passage against `query`, in the given order"""
+        if not passages:
+            return []
+        request = _Request([(query, passage) for passage in passages])
+        self._queue.put(request)
+        return request.future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        num_pairs = len(batch[0].pairs)
+        deadline = time.monotonic() + self.max_wait
+        while num_pairs < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            num_pairs += len(request.pairs)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            pairs = [pair for request in batch for pair in request.pairs]
+            start_time = time.time()
+            try:
+                scores = []
+                for i in range(0, len(pairs), self.max_batch_size):
+                    chunk = pairs[i:i + self.max_batch_size]
+                    scores.extend(self.reranker.predict(chunk, batch_size=len(chunk)))
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            with self._stats_lock:
+                self.busy_time += time.time() - start_time
+                self.pairs_scored += len(pairs)
+                self.batches += 1
+                self.requests += len(batch)
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(list(scores[offset:offset + len(request.pairs)]))
+                offset += len(request.pairs)
+
+    def stats(self):
+        """Throughput in pairs per second of model time and how well requests are being batched"""
+        with self._stats_lock:
+            return {
+                'pairs_scored': self.pairs_scored,
+                'batches': self.batches,
+                'requests': self.requests,
+                'avg_batch_pairs': self.pairs_scored / self.batches if self.batches else 0.0,
+                'pairs_per_sec': self.pairs_scored / self.busy_time if self.busy_time > 0 else 0.0,
+            }
@@ -0,0 +1,159 @@
+"""
+Redundancy-aware selection of search results.
+
+The splitter cuts each page into 1500-character chunks that overlap by 300,
+so neighbouring chunks of one page often come back together and their shared
+text would go into the prompt twice. Chunks of the same file and page whose
+text overlaps (the end of one is the start of the other, or one contains the
+other) are merged into a single span, and the slots that frees are filled
+with other candidates chosen by maximal marginal relevance (MMR), so the
+final results are both relevant and different from each other.
+"""
+import numpy as np
+
+
+def overlap_length(first, second, min_overlap=50):
+    """Length of the longest suffix of `first` that is a prefix of `second`, or 0 below `min_overlap`"""
+    if len(first) < min_overlap or len(second) < min_overlap:
+        return 0
+    probe = second[:min_overlap]
+    start = max(0, len(first) - len(second))
+    # Earliest match of the probe = longest overlap
+    position = first.find(probe, start)
+    while position != -1:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(probe, position + 1)
+    return 0
+
+
+def _join(first, second, min_overlap):
+    """Text covering both `first` and `second` if they overlap or one contains the other, else None"""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    overlap = overlap_length(first, second, min_overlap)
+    if overlap:
+        return first + second[overlap:]
+    overlap = overlap_length(second, first, min_overlap)
+    if overlap:
+        return second + first[overlap:]
+    return None
+
+
+def merge_overlapping(candidates, min_overlap=50):
+    """
+    Merge candidates (best first) from the same file and page whose text overlaps.
+    Returns a list of spans, each (text, member indexes), ordered by their best member.
+    """
+    spans = []
+    for index, doc in enumerate(candidates):
+        key = (doc.metadata.get("file_name"), doc.metadata.get("page"))
+        text, members = doc.page_content, [index]
+        # A new chunk can bridge two spans (A and C, then B), so keep merging until nothing joins
+        merged = True
+        while merged:
+            merged = False
+            for span in spans:
+                if span[0] != key:
+                    continue
+                joined = _join(span[1], text, min_overlap)
+                if joined is not None:
+                    spans.remove(span)
+                    text, members = joined, sorted(span[2] + members)
+                    merged = True
+                    break
+        spans.append((key, text, members))
+    spans.sort(key=lambda span: span[2][0])
+    return [(text, members) for _, text, members in spans]
+
+
+def mmr_order(relevance, vectors, k, lambda_mult=0.7):
+    """
+    Indexes of up to `k` items picked by maximal marginal relevance:
+    lambda * relevance - (1 - lambda) * highest cosine with an item already picked.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1)
+    relevance = np.asarray(relevance, dtype=np.float32)
+
+    selected = []
+    redundancy = np.zeros(len(relevance), dtype=np.float32)
+    remaining = list(range(len(relevance)))
+    while remaining and len(selected) < k:
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy[remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return selected
+
+
+def select_results(candidates, vectors, k, scores=None, lambda_mult=0.7, min_overlap=50):
+    """
+    Merge overlapping candidates and pick `k` spans by MMR.
+
+    `candidates` are Documents ordered best first and `vectors` their embeddings.
+    `scores` (higher is better) set each candidate's relevance; without them it
+    falls off linearly with rank. A span is as relevant as its best member and
+    its vector is the mean of its members'. Merged spans keep the metadata of
+    their best member plus `merged_chunk_ids`.
+    Returns (documents, stats) with stats {'candidates', 'merged', 'chars_saved'}.
+    """
+    from langchain_core.documents import Document
+
+    if scores is None:
+        relevance = 1.0 - np.arange(len(candidates)) / max(len(candidates), 1)
+    else:
+        scores = np.asarray(scores, dtype=np.float32)
+        spread = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / spread if spread > 0 else np.ones(len(scores))
+
+    spans = merge_overlapping(candidates, min_overlap)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    span_vectors = [vectors[members].mean(axis=0) for _, members in spans]
+    span_relevance = [max(relevance[i] for i in members) for _, members in spans]
+    order = mmr_order(span_relevance, span_vectors, k, lambda_mult)
+
+    results = []
+    merged = 0
+    chars_saved = 0
+    for span_index in order:
+        text, members = spans[span_index]
+        best = candidates[members[0]]
+        if len(members) == 1:
+            results.append(best)
+            continue
+        merged += len(members) - 1
+        chars_saved += sum(len(candidates[i].page_content) for i in members) - len(text)
+        metadata = dict(best.metadata)
+        metadata["merged_chunk_ids"] = [candidates[i].metadata.get("chunk_id") for i in members]
+        results.append(Document(page_content=text, metadata=metadata))
+
+    return results, {'candidates': len(candidates), 'merged': merged, 'chars_saved': chars_saved}
+
+
+def adaptive_cutoff(scores, max_k, min_k=1, gap=0.15, relative=0.6, min_score=0.2):
+    """
+    How many of `scores` (best first, on a 0-1 scale such as sigmoid reranker
+    scores) are worth keeping, at most `max_k`.
+
+    The list is cut before the first score that is below `min_score`, below
+    `relative` times the top score, or `gap` or more below the score before it.
+    Returns (count, reason) with reason "max_k", "min_confidence", "relative",
+    "gap", or "noise" when even the top score is below `min_score`.
+    """
+    scores = [min(max(float(score), 0.0), 1.0) for score in scores[:max_k]]
+    if not scores:
+        return 0, "max_k"
+    if scores[0] < min_score:
+        return min(min_k, len(scores)), "noise"
+    for i in range(1, len(scores)):
+        if scores[i] < min_score:
+            return max(i, min_k), "min_confidence"
+        if scores[i] < relative * scores[0]:
+            return max(i, min_k), "relative"
+        if scores[i - 1] - scores[i] >= gap:
+            return max(i, min_k), "gap"
+    return len(scores), "max_k"
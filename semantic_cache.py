@@ -0,0 +1,97 @@
+import time
+import threading
+import collections
+import numpy as np
+
+
+class SemanticQueryCache:
+    """
+    Search-result cache that also answers paraphrases of earlier questions.
+
+    Entries are keyed by the query's embedding; a lookup hits when the cosine
+    similarity with a stored query reaches `threshold`. Entries expire after
+    `ttl` seconds, the least recently used one is evicted beyond `max_entries`,
+    and every entry records the corpus version it was computed for - once the
+    processor bumps its version (any ingest or removal), older entries are
+    dropped instead of being served stale. An entry also records the query's
+    codes and numbers (bm25_index.code_tokens): "Điều 12 quy định gì?" and
+    "Điều 13 quy định gì?" embed almost identically but never share results.
+    """
+
+    def __init__(self, max_entries=100, ttl=3600.0, threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        # id -> (unit query vector, corpus version, time stored, results, latency to compute them, codes)
+        self._entries = collections.OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency = 0.0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _expire(self, corpus_version):
+        now = time.time()
+        for entry_id in [
+            entry_id for entry_id, (_, version, stored, _, _, _) in self._entries.items()
+            if version != corpus_version or now - stored > self.ttl
+        ]:
+            del self._entries[entry_id]
+
+    def get(self, query_vector, corpus_version, codes=frozenset()):
+        """
+        Return (results, similarity) for the closest cached query with the same
+        `codes`, or (None, best similarity)
+        """
+        query = self._unit(query_vector)
+        with self._lock:
+            self._expire(corpus_version)
+            best_id, best_similarity = None, 0.0
+            ids = [entry_id for entry_id, entry in self._entries.items() if entry[5] == codes]
+            if ids:
+                similarities = np.stack([self._entries[entry_id][0] for entry_id in ids]) @ query
+                best = int(np.argmax(similarities))
+                best_id, best_similarity = ids[best], float(similarities[best])
+
+            if best_id is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None, best_similarity
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            _, _, _, results, latency, _ = self._entries[best_id]
+            self.saved_latency += latency
+            return results, best_similarity
+
+    def put(self, query_vector, corpus_version, results, latency, codes=frozenset()):
+        with self._lock:
+            self._entries[self._next_id] = (
+                self._unit(query_vector), corpus_version, time.time(), results, latency, frozenset(codes)
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'saved_latency': self.saved_latency,
+                'entries': len(self._entries),
+            }
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_cache import CachedEmbeddings
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic vectors derived from the text, counting the texts it embeds"""
+    model_name = "fake-model"
+
+    def __init__(self):
+        self.embedded = []
+
+    @staticmethod
+    def vector(text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), float(text.count("a"))]
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.vector(text)
+
+
+def test_instances_sharing_a_directory(tmp_path):
+    first_model, second_model = FakeEmbeddings(), FakeEmbeddings()
+    first = CachedEmbeddings(first_model, cache_dir=str(tmp_path))
+    second = CachedEmbeddings(second_model, cache_dir=str(tmp_path))
+
+    first.embed_documents(["alpha", "beta"])
+    # "gamma" goes after the rows `first` wrote, not at row 0 of `second`'s own index
+    second.embed_documents(["gamma"])
+    # "alpha" was appended by `first` after `second` loaded: it's reused, not embedded again
+    second.embed_documents(["alpha", "delta"])
+    first.embed_documents(["gamma", "beta"])
+
+    assert first_model.embedded == ["alpha", "beta"]
+    assert second_model.embedded == ["gamma", "delta"]
+
+    texts = ["alpha", "beta", "gamma", "delta"]
+    for cache in (first, second, CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))):
+        for text, vector in zip(texts, cache.lookup(texts)):
+            np.testing.assert_array_equal(vector, FakeEmbeddings.vector(text))
+
+
+def test_duplicate_and_torn_rows_on_load(tmp_path):
+    cache = CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))
+    cache.embed_documents(["alpha", "beta"])
+
+    # A key written twice keeps its first row; a vector without a key is a torn tail
+    with open(cache._keys_path, 'a') as f:
+        f.write(cache._key("alpha") + "\n")
+    with open(cache._vectors_path, 'ab') as f:
+        f.write(np.asarray([[9.0, 9.0, 9.0], [8.0, 8.0, 8.0]], dtype=np.float32).tobytes())
+
+    reloaded = CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))
+    assert os.path.getsize(reloaded._vectors_path) == 3 * 3 * 4
+    np.testing.assert_array_equal(reloaded.lookup(["alpha"])[0], FakeEmbeddings.vector("alpha"))
+
+    reloaded.embed_documents(["gamma"])
+    again = CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))
+    for text, vector in zip(["alpha", "beta", "gamma"], again.lookup(["alpha", "beta", "gamma"])):
+        np.testing.assert_array_equal(vector, FakeEmbeddings.vector(text))
@@ -0,0 +1,718 @@
+"""
+Vector store backends behind PDFProcessor.db.
+
+The processors only need a small part of a vector store: upsert chunks with
+precomputed vectors, update their metadata, fetch/delete them by ID or file
+name, search by vector with a relevance score, and reclaim space. ChromaStore
+wraps langchain_chroma.Chroma (the original store); FaissStore keeps the same
+data in a FAISS index (flat, HNSW, IVF-PQ, or int8/binary codes) plus an
+SQLite side file for the documents and metadata.
+"""
+import os
+import json
+import math
+import sqlite3
+import threading
+import numpy as np
+from index_maintenance import directory_size
+
+VECTOR_STORES = ("chroma", "faiss-flat", "faiss-hnsw", "faiss-ivfpq", "faiss-int8", "faiss-binary")
+# Index types whose scores are approximate: candidates are rescored with exact vectors
+LOSSY_INDEX_TYPES = ("ivfpq", "int8", "binary")
+# k-means wants ~39 training points per centroid; PQ codebooks have 256 centroids each
+IVFPQ_MIN_TRAIN = 39 * 256
+# Trained indexes learn from a random sample of at most this many vectors (~200 MB at 768 dimensions)
+TRAIN_SAMPLE_SIZE = 65536
+# Vectors read and added to the index at a time when it is rebuilt
+REBUILD_BATCH_SIZE = 10000
+
+
+def _euclidean_relevance(squared_distance):
+    """Same mapping langchain_chroma uses for its default l2 space"""
+    return 1.0 - squared_distance / math.sqrt(2)
+
+
+class ChromaStore:
+    """Chroma collection in `db_directory` (what the processors have always used)"""
+
+    def __init__(self, db_directory, embeddings, client_settings=None):
+        from langchain_chroma import Chroma
+
+        self.db_directory = db_directory
+        kwargs = {'client_settings': client_settings} if client_settings is not None else {}
+        self.chroma = Chroma(persist_directory=db_directory, embedding_function=embeddings, **kwargs)
+
+    def count(self):
+        return self.chroma._collection.count()
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        self.chroma._collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def update_metadata(self, ids, metadatas):
+        self.chroma._collection.update(ids=ids, metadatas=metadatas)
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        return self.chroma.get(ids=ids, where=where, include=list(include), limit=limit, offset=offset)
+
+    def delete(self, ids):
+        if ids:
+            self.chroma.delete(ids=ids)
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k):
+        results = self.chroma.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+        relevance_score_fn = self.chroma._select_relevance_score_fn()
+        return [(doc, relevance_score_fn(distance)) for doc, distance in results]
+
+    def similarity_search_by_vector(self, embedding, k):
+        return self.chroma.similarity_search_by_vector(embedding, k=k)
+
+    def persist(self):
+        """Chroma writes through on every call"""
+
+    def compact(self):
+        from index_maintenance import remove_orphan_segments, vacuum_chroma
+        remove_orphan_segments(self.db_directory)
+        vacuum_chroma(self.db_directory)
+
+
+class _VectorFile:
+    """
+    Exact float32 vectors in a flat file, opened with np.memmap; row i holds the
+    chunk whose integer ID is i. Only the rows that are read end up in RAM.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dim = None
+        self._array = None
+
+    def _map(self, rows, dim):
+        size = rows * dim * 4
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < size:
+            with open(self.path, 'ab') as f:
+                f.truncate(size)
+        self.dim = dim
+        self._array = np.memmap(self.path, dtype=np.float32, mode='r+', shape=(rows, dim))
+
+    def open(self, dim):
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= dim * 4:
+            self._map(os.path.getsize(self.path) // (dim * 4), dim)
+
+    def write(self, int_ids, vectors):
+        if len(int_ids) == 0:
+            return
+        needed = int(max(int_ids)) + 1
+        if self._array is None or self._array.shape[0] < needed:
+            # Grow by doubling so appends don't remap the file every time
+            current = 0 if self._array is None else self._array.shape[0]
+            self._array = None
+            self._map(max(needed, 2 * current, 1024), vectors.shape[1])
+        self._array[np.asarray(int_ids)] = vectors
+
+    def read(self, int_ids):
+        return np.asarray(self._array[np.asarray(int_ids)])
+
+    @property
+    def rows(self):
+        return 0 if self._array is None else self._array.shape[0]
+
+    def reset(self):
+        self._array = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def flush(self):
+        if self._array is not None:
+            self._array.flush()
+
+
+class FaissStore:
+    """
+    FAISS index persisted under `db_directory/faiss/`.
+
+    `chunks.sqlite3` holds one row per chunk with its integer FAISS ID, text
+    and metadata. Each vector is stored as float32 once: in the index itself
+    for the exact types (flat, HNSW), which are rebuilt from it, and in
+    `vectors.f32` for the lossy ones, which need it to rescore and retrain.
+    `index.faiss` is opened memory-mapped, so start-up doesn't read the whole
+    index into RAM; the first write loads it properly. Adds and deletes are
+    incremental. HNSW can't remove vectors, so deleted IDs are filtered out of
+    results until compact() rebuilds the index. IVF-PQ searches exactly (flat)
+    until there are enough vectors to train it, and is retrained whenever the
+    data has doubled.
+    "int8" keeps 8-bit scalar-quantized vectors (1/4 of the float size) and
+    "binary" one sign bit per dimension (1/32). Lossy indexes only make a first
+    pass: their top `rescore_candidates` are rescored with the exact vectors in
+    `vectors.f32`, which is memory-mapped so it doesn't count against RAM.
+    Vectors are L2-normalised and searched by inner product (cosine).
+    Rows whose vector was never saved (a crash before persist()) are dropped
+    on load and their file names left in `lost_files`, so the processor can
+    ingest those files again.
+    """
+
+    def __init__(self, db_directory, index_type="flat", hnsw_m=32, ef_search=64, nprobe=16,
+                 rescore_candidates=200):
+        if index_type not in ("flat", "hnsw", "ivfpq", "int8", "binary"):
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
+        self.directory = os.path.join(db_directory, "faiss")
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.rescore_candidates = rescore_candidates
+        self._index_path = os.path.join(self.directory, f"index_{index_type}.faiss")
+        self._state_path = self._index_path + ".json"
+        self._lock = threading.RLock()
+        self._index = None
+        self._index_kind = None
+        self._writable = False
+        self._dirty = False
+        # IDs removed from the data but still in an index that can't remove them (HNSW)
+        self._tombstones = set()
+        # Number of chunks the index was last built from
+        self._built_count = 0
+
+        # Files whose chunks were dropped on load because their vectors were lost
+        self.lost_files = set()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.directory, "chunks.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chunk_id TEXT UNIQUE NOT NULL,
+                file_name TEXT,
+                document TEXT,
+                metadata TEXT
+            );
+            CREATE INDEX IF NOT EXISTS chunks_file_name ON chunks (file_name);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        # Stores written before the vectors moved out of SQLite still have a vector column
+        self._legacy_vectors = "vector" in [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        self._vector_file = None
+        if index_type in LOSSY_INDEX_TYPES:
+            self._vector_file = _VectorFile(self._vectors_path(self._generation()))
+            # Shared by every lossy index type on this directory, so its width is kept with the rows
+            if self._meta("dim") is not None:
+                self._vector_file.open(int(self._meta("dim")))
+            # Files of other generations are left over from a compact() interrupted by a crash
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.startswith("vectors") and name.endswith(".f32") and path != self._vector_file.path:
+                    os.remove(path)
+        self._load_index()
+
+    # --- index persistence -------------------------------------------------
+
+    def _meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    def _version(self):
+        return int(self._meta("version", "0"))
+
+    def _bump_version(self):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(self._version() + 1),)
+        )
+
+    def _generation(self):
+        """Bumped by compact() when it renumbers the integer IDs"""
+        return int(self._meta("generation", "0"))
+
+    def _vectors_path(self, generation):
+        return os.path.join(self.directory, "vectors.f32" if generation == 0 else f"vectors.{generation}.f32")
+
+    def _load_index(self):
+        import faiss
+
+        state = None
+        if os.path.exists(self._index_path) and os.path.exists(self._state_path):
+            with open(self._state_path, 'r') as f:
+                state = json.load(f)
+        # An index from before the IDs were last renumbered can't be matched to the rows any more
+        if state is not None and not self._legacy_vectors and state.get("generation", 0) == self._generation():
+            read_index = faiss.read_index_binary if state["kind"] == "binary" else faiss.read_index
+            vectors_ok = self._vector_file is None or self._vector_file.rows > 0
+            if state.get("version") == self._version() and vectors_ok:
+                try:
+                    self._index = read_index(self._index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                except RuntimeError:
+                    # Not every index type supports mmap
+                    self._index = read_index(self._index_path)
+                    self._writable = True
+                self._index_kind = state["kind"]
+                self._tombstones = set(state.get("tombstones", []))
+                self._built_count = state.get("built_count", 0)
+                self._configure()
+                return
+            if self._vector_file is None:
+                # Older than chunks.sqlite3 (e.g. a crash before persist), but it still
+                # holds the vectors of the rows it has seen: rebuild from those
+                self._index = read_index(self._index_path)
+                self._index_kind = state["kind"]
+        self._rebuild()
+
+    def _configure(self):
+        import faiss
+
+        if self._index_kind == "hnsw":
+            faiss.downcast_index(self._index.index).hnsw.efSearch = self.ef_search
+        elif self._index_kind == "ivfpq":
+            faiss.extract_index_ivf(self._index).nprobe = self.nprobe
+
+    def _ensure_writable(self):
+        import faiss
+
+        if self._index is not None and not self._writable:
+            read_index = faiss.read_index_binary if self._index_kind == "binary" else faiss.read_index
+            self._index = read_index(self._index_path)
+            self._writable = True
+            self._configure()
+
+    def _new_index(self, dim, count, training_sample):
+        """Empty index of the configured type for `count` vectors, trained on training_sample() if it needs it"""
+        import faiss
+
+        kind = self.index_type
+        if kind == "ivfpq":
+            if count < IVFPQ_MIN_TRAIN:
+                # Too few vectors to train on, and exact search is cheap at this size anyway
+                kind = "flat"
+            else:
+                sample = training_sample()
+                nlist = max(1, min(int(4 * math.sqrt(count)), len(sample) // 39))
+                # Sub-vectors of at least 4 dimensions
+                m = next((m for m in (64, 48, 32, 16, 8, 4, 2, 1) if dim % m == 0 and dim // m >= 4), 1)
+                quantizer = faiss.IndexFlatIP(dim)
+                base = faiss.IndexIVFPQ(quantizer, dim, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+                base.train(sample)
+                # IVF stores our IDs itself; an IndexIDMap on top would go out of step
+                # on remove_ids, since IVF doesn't renumber the vectors left behind
+                return base, kind
+        if kind == "binary":
+            # Hamming distance over sign bits (np.packbits pads to whole bytes)
+            return faiss.IndexBinaryIDMap2(faiss.IndexBinaryFlat(8 * math.ceil(dim / 8))), kind
+        if kind == "int8":
+            base = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            base.train(training_sample())
+        elif kind == "hnsw":
+            base = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        elif kind == "flat":
+            base = faiss.IndexFlatIP(dim)
+        return faiss.IndexIDMap2(base), kind
+
+    def _all_ids(self):
+        return np.array([row[0] for row in self._conn.execute("SELECT id FROM chunks ORDER BY id")], dtype=np.int64)
+
+    def _legacy_batches(self, batch_size=REBUILD_BATCH_SIZE):
+        """(integer IDs, vectors) from the vector column of a store written before it was dropped"""
+        cursor = self._conn.execute("SELECT id, vector FROM chunks ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield (
+                np.array([row[0] for row in rows], dtype=np.int64),
+                np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+            )
+
+    def _index_batches(self, source, lost, batch_size=REBUILD_BATCH_SIZE):
+        """(integer IDs, vectors) reconstructed from the exact index `source`; rows it lacks go to `lost`"""
+        import faiss
+
+        all_ids = self._all_ids()
+        indexed = faiss.vector_to_array(source.id_map) if source is not None else np.zeros(0, dtype=np.int64)
+        found = np.isin(all_ids, indexed)
+        lost.extend(all_ids[~found].tolist())
+        ids = all_ids[found]
+        for i in range(0, len(ids), batch_size):
+            yield ids[i:i + batch_size], source.reconstruct_batch(ids[i:i + batch_size])
+
+    def _stored_ids(self, lost, batch_size=REBUILD_BATCH_SIZE):
+        """IDs of the rows with a vector in vectors.f32; the others go to `lost`"""
+        all_ids = self._all_ids()
+        found = all_ids < self._vector_file.rows
+        for i in range(0, len(all_ids), batch_size):
+            block = np.flatnonzero(found[i:i + batch_size]) + i
+            # Rows never written are all zeros (stored vectors are normalised)
+            found[block] = np.any(self._vector_file.read(all_ids[block]) != 0, axis=1)
+        lost.extend(all_ids[~found].tolist())
+        return all_ids[found]
+
+    def _drop_lost(self, int_ids):
+        """Delete rows whose vector was lost and remember their files for re-ingestion"""
+        with self._conn:
+            for i in range(0, len(int_ids), 500):
+                batch = int_ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                self.lost_files.update(row[0] for row in self._conn.execute(
+                    f"SELECT DISTINCT file_name FROM chunks WHERE id IN ({placeholders})", batch
+                ) if row[0])
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch)
+            self._bump_version()
+        print(f"Dropped {len(int_ids)} chunks whose vectors were never saved, from {len(self.lost_files)} files")
+
+    def _rebuild(self):
+        """
+        Build the index from scratch without holding every vector in RAM: lossy
+        indexes train on a random sample of vectors.f32 and then add it batch by
+        batch; exact ones add the vectors of the current index (or of the stale
+        one _load_index found) batch by batch. Stores that still keep vectors in
+        SQLite are migrated here and the column dropped.
+        """
+        source = self._index
+        self._tombstones = set()
+        self._index, self._index_kind = None, None
+        lost = []
+        if self._vector_file is not None:
+            if self._legacy_vectors:
+                self._vector_file.reset()
+                for ids, vectors in self._legacy_batches():
+                    self._vector_file.write(ids, vectors)
+                if self._vector_file.dim is not None:
+                    with self._conn:
+                        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)",
+                                           (str(self._vector_file.dim),))
+            all_ids = self._stored_ids(lost)
+            if lost:
+                self._drop_lost(lost)
+            if len(all_ids):
+
+                def training_sample():
+                    rng = np.random.default_rng(0)
+                    sample_ids = all_ids if len(all_ids) <= TRAIN_SAMPLE_SIZE \
+                        else np.sort(rng.choice(all_ids, TRAIN_SAMPLE_SIZE, replace=False))
+                    return self._vector_file.read(sample_ids)
+
+                self._index, self._index_kind = self._new_index(self._vector_file.dim, len(all_ids), training_sample)
+                for i in range(0, len(all_ids), REBUILD_BATCH_SIZE):
+                    ids = all_ids[i:i + REBUILD_BATCH_SIZE]
+                    self._index.add_with_ids(self._codes(self._vector_file.read(ids)), ids)
+        else:
+            batches = self._legacy_batches() if self._legacy_vectors else self._index_batches(source, lost)
+            for ids, vectors in batches:
+                if self._index is None:
+                    self._index, self._index_kind = self._new_index(vectors.shape[1], self.count(), None)
+                self._index.add_with_ids(vectors, ids)
+            if lost:
+                self._drop_lost(lost)
+        if self._legacy_vectors:
+            with self._conn:
+                self._conn.execute("ALTER TABLE chunks DROP COLUMN vector")
+            self._conn.execute("VACUUM")
+            self._legacy_vectors = False
+        self._writable = True
+        self._dirty = True
+        self._built_count = self.count()
+        if self._index is not None:
+            self._configure()
+        self.persist()
+
+    def persist(self):
+        """Write the index to disk if it changed (atomically)"""
+        import faiss
+
+        with self._lock:
+            if not self._dirty:
+                return
+            if self._index is None:
+                for path in (self._index_path, self._state_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            else:
+                # The exact vectors must be on disk before the state says they're current
+                if self._vector_file is not None:
+                    self._vector_file.flush()
+                tmp_path = self._index_path + ".tmp"
+                write_index = faiss.write_index_binary if self._index_kind == "binary" else faiss.write_index
+                write_index(self._index, tmp_path)
+                os.replace(tmp_path, self._index_path)
+                state = {
+                    "version": self._version(),
+                    "kind": self._index_kind,
+                    "dim": self._vector_file.dim if self._vector_file is not None else self._index.d,
+                    "generation": self._generation(),
+                    "built_count": self._built_count,
+                    "tombstones": sorted(self._tombstones),
+                }
+                tmp_path = self._state_path + ".tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self._state_path)
+            self._dirty = False
+
+    # --- data ---------------------------------------------------------------
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def _codes(self, vectors):
+        """What the index stores for `vectors`: the vectors, or their sign bits for binary"""
+        if self._index_kind == "binary":
+            return np.packbits(vectors > 0, axis=1)
+        return vectors
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _remove_from_index(self, int_ids):
+        if self._index is None or not int_ids:
+            return
+        self._ensure_writable()
+        if self._index_kind == "hnsw":
+            self._tombstones.update(int_ids)
+        else:
+            self._index.remove_ids(np.array(int_ids, dtype=np.int64))
+        self._dirty = True
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        vectors = self._normalize(embeddings)
+        with self._lock, self._conn:
+            self._delete(ids)
+            int_ids = []
+            for chunk_id, vector, metadata, document in zip(ids, vectors, metadatas, documents):
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (chunk_id, file_name, document, metadata) VALUES (?, ?, ?, ?)",
+                    (chunk_id, (metadata or {}).get("file_name"), document, json.dumps(metadata or {}))
+                )
+                int_ids.append(cursor.lastrowid)
+            self._bump_version()
+            int_ids = np.array(int_ids, dtype=np.int64)
+            if self._vector_file is not None:
+                self._vector_file.write(int_ids, vectors)
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(vectors.shape[1]),))
+
+            if self._index is None and self._vector_file is None:
+                # First vectors of an exact index, which needs no training
+                self._index, self._index_kind = self._new_index(vectors.shape[1], self.count(), None)
+                self._writable = True
+                self._configure()
+            elif self._index is None or (
+                self.index_type == "ivfpq" and self.count() >= max(IVFPQ_MIN_TRAIN, 2 * self._built_count)
+            ) or (self.index_type == "int8" and self.count() >= 2 * self._built_count):
+                # First vectors, or a trained index and the data has doubled since it was
+                # trained (IVF-PQ lists/codebooks and int8 ranges fit the data they saw)
+                self._rebuild()
+                return
+            self._ensure_writable()
+            self._index.add_with_ids(self._codes(vectors), int_ids)
+            self._dirty = True
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ?, file_name = ? WHERE chunk_id = ?",
+                [(json.dumps(metadata or {}), (metadata or {}).get("file_name"), chunk_id)
+                 for chunk_id, metadata in zip(ids, metadatas)]
+            )
+            self._bump_version()
+            self._dirty = True
+
+    def _delete(self, ids):
+        int_ids = []
+        for i in range(0, len(ids), 500):
+            batch = list(ids[i:i + 500])
+            placeholders = ",".join("?" * len(batch))
+            int_ids.extend(row[0] for row in self._conn.execute(
+                f"SELECT id FROM chunks WHERE chunk_id IN ({placeholders})", batch
+            ))
+            self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+        self._remove_from_index(int_ids)
+        return int_ids
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self._lock, self._conn:
+            if self._delete(ids):
+                self._bump_version()
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        """Chroma-style get(); `where` only supports {"file_name": ...}"""
+        query = "SELECT chunk_id, document, metadata FROM chunks"
+        params = []
+        if where:
+            if set(where) != {"file_name"}:
+                raise ValueError(f"FaissStore.get only filters on file_name, got {where}")
+            query += " WHERE file_name = ?"
+            params.append(where["file_name"])
+        query += " ORDER BY id"
+        if ids is None and limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += [limit, offset or 0]
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall() if ids is None else self._rows_by_chunk_id(ids)
+        return {
+            "ids": [row[0] for row in rows],
+            "documents": [row[1] for row in rows] if "documents" in include else None,
+            "metadatas": [json.loads(row[2]) for row in rows] if "metadatas" in include else None,
+        }
+
+    def _rows_by_chunk_id(self, ids):
+        rows = {}
+        for i in range(0, len(ids), 500):
+            batch = list(ids[i:i + 500])
+            placeholders = ",".join("?" * len(batch))
+            for row in self._conn.execute(
+                f"SELECT chunk_id, document, metadata FROM chunks WHERE chunk_id IN ({placeholders})", batch
+            ):
+                rows[row[0]] = row
+        return [rows[chunk_id] for chunk_id in ids if chunk_id in rows]
+
+    def _search(self, query, k, rescore=True):
+        """Top `k` (integer ID, cosine) for a normalised query, rescoring lossy first passes"""
+        if self._index is None or self._index.ntotal == 0:
+            return []
+        lossy = self._index_kind in LOSSY_INDEX_TYPES
+        depth = max(k, self.rescore_candidates) if lossy and rescore else k
+        fetch = min(depth + len(self._tombstones), self._index.ntotal)
+        scores, int_ids = self._index.search(self._codes(query), fetch)
+        hits = [
+            (int(int_id), float(score)) for int_id, score in zip(int_ids[0], scores[0])
+            if int_id != -1 and int(int_id) not in self._tombstones
+        ]
+        if lossy and rescore and hits:
+            candidates = np.array([int_id for int_id, _ in hits], dtype=np.int64)
+            exact = self._vector_file.read(candidates) @ query[0]
+            order = np.argsort(-exact)[:k]
+            return [(int(candidates[i]), float(exact[i])) for i in order]
+        if self._index_kind == "binary":
+            # Hamming distances aren't cosines; only the order is usable
+            return [(int_id, 1.0 - 2.0 * distance / self._index.d) for int_id, distance in hits[:k]]
+        return hits[:k]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k):
+        from langchain_core.documents import Document
+
+        query = self._normalize(embedding)
+        with self._lock:
+            hits = self._search(query, k)
+            if not hits:
+                return []
+            placeholders = ",".join("?" * len(hits))
+            rows = {
+                row[0]: row for row in self._conn.execute(
+                    f"SELECT id, chunk_id, document, metadata FROM chunks WHERE id IN ({placeholders})",
+                    [int_id for int_id, _ in hits]
+                )
+            }
+
+        results = []
+        for int_id, score in hits:
+            if int_id in rows:
+                _, chunk_id, document, metadata = rows[int_id]
+                # For unit vectors, squared L2 distance = 2 - 2 * cosine
+                results.append((
+                    Document(page_content=document, metadata=json.loads(metadata), id=chunk_id),
+                    _euclidean_relevance(2 - 2 * score)
+                ))
+        return results
+
+    def similarity_search_by_vector(self, embedding, k):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k)]
+
+    def compact(self):
+        """
+        Rebuild the index without deleted vectors and retrain it on the current
+        data. Lossy stores renumber the integer IDs 1..n first, so vectors.f32
+        has no holes.
+        """
+        with self._lock:
+            if self._vector_file is not None:
+                self._renumber()
+            self._conn.execute("VACUUM")
+            self._rebuild()
+
+    def _renumber(self):
+        """
+        Renumber the integer IDs 1..n. The vectors are copied into the next
+        generation's vector file first, and the new IDs commit together with the
+        switch to it, so a crash leaves the rows and the file in step either way.
+        """
+        int_ids = self._all_ids()
+        generation = self._generation() + 1
+        renumbered = _VectorFile(self._vectors_path(generation))
+        renumbered.reset()
+        for i in range(0, len(int_ids), REBUILD_BATCH_SIZE):
+            old_ids = int_ids[i:i + REBUILD_BATCH_SIZE]
+            stored = old_ids < self._vector_file.rows
+            new_ids = np.arange(i + 1, i + 1 + len(old_ids), dtype=np.int64)
+            renumbered.write(new_ids[stored], self._vector_file.read(old_ids[stored]))
+        renumbered.flush()
+        with self._conn:
+            # Ascending, so a new ID never collides with one not yet moved
+            self._conn.executemany(
+                "UPDATE chunks SET id = ? WHERE id = ?",
+                [(new_id, int(old_id)) for new_id, old_id in enumerate(int_ids, start=1) if new_id != old_id]
+            )
+            self._conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'chunks'", (len(int_ids),))
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (str(generation),))
+            self._bump_version()
+        self._vector_file.reset()
+        self._vector_file = renumbered
+
+    def quantization_report(self, k=5, num_queries=100, seed=0):
+        """
+        Recall@k of a lossy index against exact search over all stored vectors,
+        with and without rescoring, the RAM its codes save over float32, and
+        the store's real size on disk (index, vectors.f32 and chunks.sqlite3).
+        Queries are midpoints of random pairs of stored chunks.
+        """
+        if self.index_type not in LOSSY_INDEX_TYPES:
+            raise ValueError(f"{self.index_type} index is exact, nothing to report")
+        with self._lock:
+            self.persist()
+            int_ids = np.array([row[0] for row in self._conn.execute("SELECT id FROM chunks ORDER BY id")], dtype=np.int64)
+            if len(int_ids) < 2 or self._index is None:
+                raise ValueError("Not enough vectors in the store")
+            rng = np.random.default_rng(seed)
+            pairs = rng.choice(int_ids, size=(num_queries, 2))
+            queries = self._normalize(self._vector_file.read(pairs[:, 0]) + self._vector_file.read(pairs[:, 1]))
+
+            # Exact top-k by brute force, reading the vector file in blocks
+            exact_scores = np.full((num_queries, 0), -np.inf, dtype=np.float32)
+            exact_ids = np.zeros((num_queries, 0), dtype=np.int64)
+            for i in range(0, len(int_ids), 20000):
+                block = int_ids[i:i + 20000]
+                exact_scores = np.hstack([exact_scores, queries @ self._vector_file.read(block).T])
+                exact_ids = np.hstack([exact_ids, np.broadcast_to(block, (num_queries, len(block)))])
+                top = np.argsort(-exact_scores, axis=1)[:, :k]
+                exact_scores = np.take_along_axis(exact_scores, top, axis=1)
+                exact_ids = np.take_along_axis(exact_ids, top, axis=1)
+
+            def recall(rescore):
+                found = 0
+                for query, truth in zip(queries, exact_ids):
+                    hits = self._search(query[None, :], k, rescore=rescore)
+                    found += len(set(int_id for int_id, _ in hits) & set(truth.tolist()))
+                return found / exact_ids.size
+
+            float_bytes = len(int_ids) * self._vector_file.dim * 4
+            index_bytes = os.path.getsize(self._index_path)
+            return {
+                'vectors': len(int_ids),
+                'k': k,
+                'rescore_candidates': self.rescore_candidates,
+                'recall_first_pass': recall(False),
+                'recall_rescored': recall(True),
+                'float_bytes': float_bytes,
+                'index_bytes': index_bytes,
+                'bytes_saved': float_bytes - index_bytes,
+                'disk_bytes': directory_size(self.directory),
+            }
+
+
+def create_vector_store(backend, db_directory, embeddings, client_settings=None):
+    if backend == "chroma":
+        return ChromaStore(db_directory, embeddings, client_settings)
+    if backend in VECTOR_STORES and backend.startswith("faiss-"):
+        return FaissStore(db_directory, index_type=backend[len("faiss-"):])
+    raise ValueError(f"Unknown vector store: {backend}")